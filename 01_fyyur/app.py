@@ -12,8 +12,19 @@ import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+import dedupe
+import geo
 from flask_migrate import Migrate
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import text, func, or_, and_
+from sqlalchemy.dialects.postgresql import ARRAY
+from werkzeug.utils import cached_property
+from dateutil.relativedelta import relativedelta
+from flask.cli import AppGroup
+import click
+from markupsafe import Markup
+from collections import deque
+import threading
+import time
 import datetime
 import sys
 #----------------------------------------------------------------------------#
@@ -44,6 +55,11 @@ class VenueArea(db.Model):
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_fingerprint', 'fingerprint', postgresql_using='hash'),
+        db.Index('ix_Venue_blocking_keys', 'blocking_keys', postgresql_using='gin'),
+        db.Index('ix_Venue_geohash', 'geohash'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String())
     address = db.Column(db.String(120))
@@ -56,20 +72,29 @@ class Venue(db.Model):
     area_id = db.Column(db.Integer, db.ForeignKey(
         'VenueArea.id'), nullable=False)
     genres = db.Column(db.ARRAY(db.String()))
-
-    @hybrid_property
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # duplicate detection, see dedupe.py
+    fingerprint = db.Column(db.String(40))
+    blocking_keys = db.Column(ARRAY(db.String()))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # cell index for /venues/nearby, see geo.py; the "C" collation keeps
+    # the prefix range scans in byte order, as in the migration
+    geohash = db.Column(db.String(12, collation='C'))
+
+    @cached_property
     def upcoming_shows(self):
-        return list(filter(lambda show: parse_datetime(show.start_time) >= datetime.datetime.now(), self.shows))
+        return upcoming_shows_query(Show.venue_id == self.id).all()
 
-    @hybrid_property
+    @cached_property
     def past_shows(self):
-        return list(filter(lambda show: parse_datetime(show.start_time) < datetime.datetime.now(), self.shows))
+        return past_shows_query(Show.venue_id == self.id).all()
 
-    @hybrid_property
+    @property
     def upcoming_shows_count(self):
         return len(self.upcoming_shows)
 
-    @hybrid_property
+    @property
     def past_shows_count(self):
         return len(self.past_shows)
 
@@ -81,6 +106,10 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_fingerprint', 'fingerprint', postgresql_using='hash'),
+        db.Index('ix_Artist_blocking_keys', 'blocking_keys', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -94,20 +123,24 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String())
     genres = db.Column(db.ARRAY(db.String()))
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # duplicate detection, see dedupe.py
+    fingerprint = db.Column(db.String(40))
+    blocking_keys = db.Column(ARRAY(db.String()))
 
-    @hybrid_property
+    @cached_property
     def upcoming_shows(self):
-        return list(filter(lambda show: parse_datetime(show.start_time) >= datetime.datetime.now(), self.shows))
+        return upcoming_shows_query(Show.artist_id == self.id).all()
 
-    @hybrid_property
+    @cached_property
     def past_shows(self):
-        return list(filter(lambda show: parse_datetime(show.start_time) < datetime.datetime.now(), self.shows))
+        return past_shows_query(Show.artist_id == self.id).all()
 
-    @hybrid_property
+    @property
     def upcoming_shows_count(self):
         return len(self.upcoming_shows)
 
-    @hybrid_property
+    @property
     def past_shows_count(self):
         return len(self.past_shows)
 
@@ -119,9 +152,12 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    # range partitioned by month on start_time, see the 8e3f0b6d2c51 migration.
+    # the partition key has to be part of the primary key.
+    __table_args__ = {'postgresql_partition_by': 'RANGE (start_time)'}
 
-    id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.String(), nullable=False)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    start_time = db.Column(db.DateTime, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey(
         'Artist.id'), nullable=False)
@@ -130,12 +166,23 @@ class Show(db.Model):
         return f"<{self.id}, {self.venue_id}, {self.artist_id}, {self.start_time}>"
 
 
+def upcoming_shows_query(*criteria):
+    # bounded on start_time so postgres only scans the current and future partitions
+    return Show.query.filter(
+        Show.start_time >= datetime.datetime.now(), *criteria).order_by(Show.start_time)
+
+
+def past_shows_query(*criteria):
+    return Show.query.filter(
+        Show.start_time < datetime.datetime.now(), *criteria).order_by(Show.start_time.desc())
+
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
+    date = value if isinstance(value, datetime.datetime) else dateutil.parser.parse(value)
     if format == 'full':
         format = "EEEE MMMM, d, y 'at' h:mma"
     elif format == 'medium':
@@ -152,6 +199,332 @@ def parse_datetime(value):
 #----------------------------------------------------------------------------#
 
 
+#----------------------------------------------------------------------------#
+# Partial updates.
+#----------------------------------------------------------------------------#
+
+ARTIST_PATCH_FIELDS = ('name', 'city', 'state', 'phone', 'genres', 'image_link',
+                       'website', 'facebook_link', 'seeking_venue',
+                       'seeking_description')
+VENUE_PATCH_FIELDS = ('name', 'address', 'phone', 'genres', 'image_link',
+                      'website', 'facebook_link', 'seeking_talent',
+                      'seeking_description', 'city', 'state', 'latitude',
+                      'longitude')
+
+
+class VersionConflict(Exception):
+    pass
+
+
+BOOLEAN_PATCH_FIELDS = ('seeking_venue', 'seeking_talent')
+# latitude and longitude are checked by venue_geohash
+NUMBER_PATCH_FIELDS = ('latitude', 'longitude')
+
+
+def valid_version(version):
+    # bool is an int too, but never a version
+    return isinstance(version, int) and not isinstance(version, bool)
+
+
+def valid_patch_value(key, value):
+    # the JSON type a patched column takes; null clears all but the name
+    if value is None:
+        return key != 'name'
+    if key == 'genres':
+        return isinstance(value, list) and all(
+            isinstance(genre, str) for genre in value)
+    if key in BOOLEAN_PATCH_FIELDS:
+        return isinstance(value, bool)
+    if key in NUMBER_PATCH_FIELDS:
+        return True
+    return isinstance(value, str)
+
+
+def valid_patch(values):
+    return all(valid_patch_value(key, value) for key, value in values.items())
+
+
+def patch_record(model, record_id, version, changes):
+    # one UPDATE ... WHERE id = ? AND version = ? with only the changed
+    # columns; relationships are never loaded.
+    # returns the new version, or None when the row does not exist.
+    if not changes:
+        return version
+    values = dict(changes)
+    values['version'] = model.version + 1
+    updated = db.session.query(model).filter(
+        model.id == record_id, model.version == version).update(
+        values, synchronize_session=False)
+    if updated:
+        db.session.commit()
+        return version + 1
+    db.session.rollback()
+    if db.session.query(model.id).filter(model.id == record_id).first() is None:
+        return None
+    raise VersionConflict()
+
+
+def changed_columns(model, record_id, values):
+    # compares submitted values against a column-only select of the row
+    columns = [getattr(model, key) for key in values]
+    current = db.session.query(*columns).filter(
+        model.id == record_id).one_or_none()
+    if current is None:
+        return None
+    return {key: value for (key, value), old in zip(values.items(), current)
+            if value != old}
+
+
+def resolve_area_id(city, state):
+    area = db.session.query(VenueArea.id).filter_by(
+        state=state, city=city).first()
+    if area is not None:
+        return area.id
+    area = VenueArea(state=state, city=city)
+    db.session.add(area)
+    db.session.flush()
+    return area.id
+
+
+class InvalidLocation(ValueError):
+    pass
+
+
+def venue_changes(venue_id, values):
+    # city and state live on VenueArea, so they are swapped for area_id
+    changes = dict(values)
+    city = changes.pop('city', None)
+    state = changes.pop('state', None)
+    if city is not None or state is not None:
+        if city is None or state is None:
+            raise ValueError('city and state must be updated together')
+        changes['area_id'] = resolve_area_id(city, state)
+    if 'latitude' in changes or 'longitude' in changes:
+        # a coordinate left out keeps its stored value
+        latitude = changes.get('latitude')
+        longitude = changes.get('longitude')
+        if 'latitude' not in changes or 'longitude' not in changes:
+            current = db.session.query(Venue.latitude, Venue.longitude).filter(
+                Venue.id == venue_id).one_or_none()
+            if current is not None:
+                latitude = changes.get('latitude', current.latitude)
+                longitude = changes.get('longitude', current.longitude)
+        changes['geohash'] = venue_geohash(latitude, longitude)
+    return changes
+
+
+def venue_geohash(latitude, longitude):
+    if latitude is None and longitude is None:
+        return None
+    if latitude is None or longitude is None:
+        raise InvalidLocation('latitude and longitude must be set together')
+    for value in (latitude, longitude):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise InvalidLocation('latitude and longitude must be numbers')
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise InvalidLocation('latitude or longitude out of range')
+    return geo.encode(latitude, longitude)
+
+
+#----------------------------------------------------------------------------#
+# Duplicate detection.
+#----------------------------------------------------------------------------#
+
+IDENTITY_FIELDS = ('name', 'phone', 'city', 'state')
+
+
+def identity_query(model):
+    # (id, name, phone, city, state) of venues or artists, column-only
+    if model is Venue:
+        return db.session.query(Venue.id, Venue.name, Venue.phone,
+                                VenueArea.city, VenueArea.state).join(VenueArea)
+    return db.session.query(Artist.id, Artist.name, Artist.phone,
+                            Artist.city, Artist.state)
+
+
+def with_fingerprint(model, record_id, values):
+    # adds fingerprint and blocking_keys when an identity field is submitted;
+    # the identity fields that are not submitted are read from the row
+    if not any(key in values for key in IDENTITY_FIELDS):
+        return values
+    identity = {key: values[key] for key in IDENTITY_FIELDS if key in values}
+    if len(identity) < len(IDENTITY_FIELDS):
+        row = identity_query(model).filter(model.id == record_id).one_or_none()
+        if row is None:
+            return values
+        for key in IDENTITY_FIELDS:
+            identity.setdefault(key, getattr(row, key))
+    values = dict(values)
+    values['fingerprint'] = dedupe.fingerprint(**identity)
+    values['blocking_keys'] = dedupe.blocking_keys(**identity)
+    return values
+
+
+def find_duplicates(model, name, fingerprint, keys):
+    # candidates come from the fingerprint and blocking key indexes only.
+    # exact matches are never limited, so common blocking keys cannot
+    # crowd them out of the fuzzy candidates.
+    columns = (model.id, model.name, model.fingerprint)
+    exact = db.session.query(*columns).filter(
+        model.fingerprint == fingerprint).all()
+    candidates = db.session.query(*columns).filter(
+        model.blocking_keys.overlap(keys),
+        model.fingerprint != fingerprint).limit(
+        app.config['DUPLICATE_CANDIDATES_LIMIT']).all()
+    near = [candidate for candidate in candidates
+            if dedupe.is_near_duplicate(name, candidate.name)]
+    return exact, near
+
+
+def flash_near_duplicates(near):
+    if near:
+        flash('It looks similar to ' + ', '.join(
+            listing.name for listing in near) +
+            '. Please check it is not a duplicate.', 'error')
+
+
+dedupe_cli = AppGroup('dedupe', help='Find duplicate venues and artists.')
+app.cli.add_command(dedupe_cli)
+DEDUPE_MODELS = {'venues': Venue, 'artists': Artist}
+
+
+@dedupe_cli.command('backfill')
+@click.argument('kind', type=click.Choice(DEDUPE_MODELS))
+@click.option('--batch-size', default=1000)
+def backfill_fingerprints(kind, batch_size):
+    """Compute fingerprints and blocking keys for existing rows."""
+    model = DEDUPE_MODELS[kind]
+    last_id = 0
+    while True:
+        rows = identity_query(model).filter(model.id > last_id).order_by(
+            model.id).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.bulk_update_mappings(model, [{
+            'id': row.id,
+            'fingerprint': dedupe.fingerprint(row.name, row.phone, row.city, row.state),
+            'blocking_keys': dedupe.blocking_keys(row.name, row.phone, row.city, row.state)
+        } for row in rows])
+        db.session.commit()
+        last_id = rows[-1].id
+        click.echo(f'{kind}: backfilled up to id {last_id}')
+
+
+@dedupe_cli.command('report')
+@click.argument('kind', type=click.Choice(DEDUPE_MODELS))
+@click.option('--max-block', default=50,
+              help='Skip blocking keys shared by more rows than this '
+                   'when looking for near duplicates.')
+def dedupe_report(kind, max_block):
+    """Print clusters of exact and near-duplicate rows."""
+    model = DEDUPE_MODELS[kind]
+    pairs = []
+    # exact duplicates share a fingerprint; this pass is not capped, so
+    # the largest clusters, whose blocks are all over max_block, show up
+    exact = db.session.query(func.array_agg(model.id)).filter(
+        model.fingerprint.isnot(None)).group_by(model.fingerprint).having(
+        func.count() > 1).execution_options(stream_results=True)
+    for ids, in exact.yield_per(1000):
+        pairs.extend((ids[0], other_id) for other_id in ids[1:])
+    # the grouping runs in the database, only blocks with more than one
+    # row come back, and names are only compared inside a block
+    keyed = db.session.query(
+        model.id.label('id'), model.name.label('name'),
+        func.unnest(model.blocking_keys).label('key')).subquery()
+    blocks = db.session.query(
+        func.array_agg(keyed.c.id), func.array_agg(keyed.c.name)).group_by(
+        keyed.c.key).having(func.count() > 1).having(
+        func.count() <= max_block).execution_options(stream_results=True)
+    for ids, names in blocks.yield_per(1000):
+        pairs.extend(dedupe.near_duplicate_pairs(list(zip(ids, names))))
+    clusters = dedupe.cluster(pairs)
+
+    rows = {}
+    clustered_ids = [listing_id for members in clusters for listing_id in members]
+    for start in range(0, len(clustered_ids), 1000):
+        rows.update((row.id, row) for row in db.session.query(
+            model.id, model.name, model.fingerprint).filter(
+            model.id.in_(clustered_ids[start:start + 1000])))
+    for members in clusters:
+        kind_of_match = 'exact' if len(
+            {rows[member].fingerprint for member in members}) == 1 else 'near'
+        click.echo(f'{kind_of_match}\t' + '\t'.join(
+            f'{member}:{rows[member].name}' for member in members))
+    click.echo(f'{len(clusters)} clusters, {len(clustered_ids)} {kind}')
+
+
+#----------------------------------------------------------------------------#
+# Recent listings.
+#----------------------------------------------------------------------------#
+
+class RecentListings:
+    '''
+    bounded ring buffers of the newest venues and artists.
+    the create handlers push into them, the database is only read on cold
+    start and every `resync_interval` seconds to pick up listings made by
+    other workers, and the rendered fragment is cached for `fragment_ttl`
+    seconds, so the home page itself runs no queries.
+    '''
+
+    def __init__(self, size, fragment_ttl, resync_interval):
+        self.size = size
+        self.fragment_ttl = fragment_ttl
+        self.resync_interval = resync_interval
+        self.venues = deque(maxlen=size)
+        self.artists = deque(maxlen=size)
+        self.synced_at = None
+        self.fragment = None
+        self.fragment_expires = 0
+        self.lock = threading.Lock()
+
+    def add_venue(self, venue_id, name):
+        self.venues.appendleft({'id': venue_id, 'name': name})
+        self.fragment = None
+
+    def add_artist(self, artist_id, name):
+        self.artists.appendleft({'id': artist_id, 'name': name})
+        self.fragment = None
+
+    def remove_venue(self, venue_id):
+        self.venues = deque((venue for venue in self.venues
+                             if venue['id'] != venue_id), maxlen=self.size)
+        self.fragment = None
+
+    def sync(self):
+        venues = db.session.query(Venue.id, Venue.name).order_by(
+            Venue.id.desc()).limit(self.size).all()
+        artists = db.session.query(Artist.id, Artist.name).order_by(
+            Artist.id.desc()).limit(self.size).all()
+        self.venues = deque(({'id': id, 'name': name} for id, name in venues),
+                            maxlen=self.size)
+        self.artists = deque(({'id': id, 'name': name} for id, name in artists),
+                             maxlen=self.size)
+        self.synced_at = time.monotonic()
+        self.fragment = None
+
+    def render(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.synced_at is None or now - self.synced_at >= self.resync_interval:
+                self.sync()
+            if self.fragment is None or now >= self.fragment_expires:
+                self.fragment = Markup(render_template(
+                    'pages/recent_listings.html',
+                    venues=list(self.venues), artists=list(self.artists)))
+                self.fragment_expires = now + self.fragment_ttl
+            return self.fragment
+
+
+recent_listings = RecentListings(app.config['RECENT_LISTINGS_SIZE'],
+                                 app.config['RECENT_LISTINGS_TTL'],
+                                 app.config['RECENT_LISTINGS_RESYNC'])
+
+
+def render_home():
+    return render_template('pages/home.html',
+                           recent_listings=recent_listings.render())
+
+
 app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
@@ -161,7 +534,7 @@ app.jinja_env.filters['datetime'] = format_datetime
 
 @app.route('/')
 def index():
-    return render_template('pages/home.html')
+    return render_home()
 
 
 #  Venues
@@ -187,6 +560,46 @@ def search_venues():
     return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 
+@app.route('/venues/nearby')
+def nearby_venues():
+    # venues within radius km of lat/lng; the geohash cells covering the
+    # circle prune the candidates before the exact haversine distance
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    radius = request.args.get(
+        'radius', app.config['NEARBY_DEFAULT_RADIUS_KM'], type=float)
+    if (latitude is None or longitude is None or not -90 <= latitude <= 90
+            or not -180 <= longitude <= 180
+            or not 0 < radius <= app.config['NEARBY_MAX_RADIUS_KM']):
+        abort(400)
+    candidates = db.session.query(
+        Venue.id, Venue.name, Venue.latitude, Venue.longitude)
+    cells = geo.covering_cells(latitude, longitude, radius)
+    if cells:
+        # prefix ranges, '{' sorts right after the last base32 character
+        candidates = candidates.filter(or_(*[
+            and_(Venue.geohash >= cell, Venue.geohash < cell + '{')
+            for cell in cells]))
+    else:
+        candidates = candidates.filter(Venue.geohash.isnot(None))
+    data = []
+    for venue in candidates:
+        distance = geo.haversine(latitude, longitude,
+                                 venue.latitude, venue.longitude)
+        if distance <= radius:
+            data.append({
+                'id': venue.id,
+                'name': venue.name,
+                'distance': round(distance, 3)
+            })
+    data.sort(key=lambda venue: venue['distance'])
+    return jsonify({
+        'success': True,
+        'count': len(data),
+        'data': data
+    })
+
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
@@ -208,6 +621,7 @@ def create_venue_form():
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     error = False
+    exact, near = [], []
     try:
         name = request.form.get('name')
         city = request.form.get('city')
@@ -216,14 +630,24 @@ def create_venue_submission():
         phone = request.form.get('phone')
         facebook_link = request.form.get('facebook_link')
         genres = request.form.getlist('genres')
-        area = VenueArea.query.filter_by(state=state, city=city).one_or_none()
-        if area is None:
-            area = VenueArea(state=state, city=city)
-
-        venue = Venue(name=name, phone=phone, facebook_link=facebook_link,
-                      address=address, area=area, genres=genres)
-        db.session.add(area)
-        db.session.commit()
+        latitude = request.form.get('latitude', type=float)
+        longitude = request.form.get('longitude', type=float)
+        fingerprint = dedupe.fingerprint(name, phone, city, state)
+        keys = dedupe.blocking_keys(name, phone, city, state)
+        exact, near = find_duplicates(Venue, name, fingerprint, keys)
+        if not exact:
+            area = VenueArea.query.filter_by(state=state, city=city).one_or_none()
+            if area is None:
+                area = VenueArea(state=state, city=city)
+
+            venue = Venue(name=name, phone=phone, facebook_link=facebook_link,
+                          address=address, area=area, genres=genres,
+                          fingerprint=fingerprint, blocking_keys=keys,
+                          latitude=latitude, longitude=longitude,
+                          geohash=venue_geohash(latitude, longitude))
+            db.session.add(area)
+            db.session.commit()
+            recent_listings.add_venue(venue.id, venue.name)
 
     except:
         db.session.rollback()
@@ -235,10 +659,13 @@ def create_venue_submission():
         # on unsuccessful db insert, flash error
         flash('An error occurred. Venue ' + name +
               ' could not be listed.', 'error')
+    elif exact:
+        flash('Venue ' + name + ' is already listed.', 'error')
     else:
         # on successful db insert, flash success
         flash('Venue ' + name + ' was successfully listed!')
-    return render_template('pages/home.html')
+        flash_near_duplicates(near)
+    return render_home()
 
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
@@ -246,6 +673,7 @@ def delete_venue(venue_id):
     try:
         Venue.query.filter_by(id=venue_id).delete()
         db.session.commit()
+        recent_listings.remove_venue(int(venue_id))
     except:
         db.session.rollback()
     finally:
@@ -286,70 +714,136 @@ def show_artist(artist_id):
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-    form = ArtistForm()
     artist = Artist.query.filter_by(id=artist_id).first()
     if artist is None:
         abort(404)
+    form = ArtistForm(obj=artist)
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
-    artist = Artist.query.filter_by(id=artist_id).first()
-    if artist is None:
-        abort(404)
+    values = {
+        'name': request.form.get('name'),
+        'city': request.form.get('city'),
+        'state': request.form.get('state'),
+        'phone': request.form.get('phone'),
+        'facebook_link': request.form.get('facebook_link'),
+        'genres': request.form.getlist('genres')
+    }
+    version = request.form.get('version', type=int)
+    if version is None or not values['name']:
+        abort(400)
     try:
-        artist.city = request.form.get('city')
-        artist.state = request.form.get('state')
-        artist.phone = request.form.get('phone')
-        artist.facebook_link = request.form.get('facebook_link')
-        artist.genres = request.form.getlist('genres')
-        db.session.commit()
-
-    except:
-        db.session.rollback()
+        changes = changed_columns(Artist, artist_id,
+                                  with_fingerprint(Artist, artist_id, values))
+        if changes is None or patch_record(Artist, artist_id, version, changes) is None:
+            abort(404)
+        flash('Artist ' + values['name'] + ' was successfully updated!')
+    except VersionConflict:
+        flash('Artist ' + values['name'] + ' was changed by someone else. '
+              'Please review the latest details and try again.', 'error')
+        return redirect(url_for('edit_artist', artist_id=artist_id))
     finally:
         db.session.close()
     return redirect(url_for('show_artist', artist_id=artist_id))
 
 
+@app.route('/artists/<int:artist_id>', methods=['PATCH'])
+def patch_artist(artist_id):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    version = body.pop('version', None)
+    changes = {key: body[key] for key in ARTIST_PATCH_FIELDS if key in body}
+    if (not valid_version(version) or len(changes) != len(body)
+            or not valid_patch(changes)):
+        abort(400)
+    try:
+        version = patch_record(Artist, artist_id, version,
+                               with_fingerprint(Artist, artist_id, changes))
+    except VersionConflict:
+        return jsonify({'success': False, 'error': 409,
+                        'message': 'version conflict'}), 409
+    finally:
+        db.session.close()
+    if version is None:
+        abort(404)
+    return jsonify({'success': True, 'id': artist_id, 'version': version})
+
+
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-    form = VenueForm()
     venue = Venue.query.filter_by(id=venue_id).first()
     if venue is None:
         abort(404)
+    form = VenueForm(obj=venue)
+    form.city.data = venue.area.city
+    form.state.data = venue.area.state
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     # venue record with ID <venue_id> using the new attributes
-    venue = Venue.query.filter_by(id=venue_id).first()
-    if venue is None:
-        abort(404)
+    values = {
+        'name': request.form.get('name'),
+        'address': request.form.get('address'),
+        'phone': request.form.get('phone'),
+        'facebook_link': request.form.get('facebook_link'),
+        'genres': request.form.getlist('genres'),
+        'city': request.form.get('city'),
+        'state': request.form.get('state'),
+        'latitude': request.form.get('latitude', type=float),
+        'longitude': request.form.get('longitude', type=float)
+    }
+    version = request.form.get('version', type=int)
+    if version is None or not values['name']:
+        abort(400)
     try:
-        city = request.form.get('city')
-        state = request.form.get('state')
-        venue.name = request.form.get('name')
-        venue.address = request.form.get('address')
-        venue.phone = request.form.get('phone')
-        venue.facebook_link = request.form.get('facebook_link')
-        venue.genres = request.form.getlist('genres')
-        area = VenueArea.query.filter_by(state=state, city=city).one_or_none()
-        if area is None:
-            area = VenueArea(state=state, city=city)
-            db.session.add(area)
-        venue.area_list = area.id
-        db.session.commit()
-
-    except:
-        db.session.rollback()
+        changes = changed_columns(Venue, venue_id, venue_changes(
+            venue_id, with_fingerprint(Venue, venue_id, values)))
+        if changes is None or patch_record(Venue, venue_id, version, changes) is None:
+            abort(404)
+        flash('Venue ' + values['name'] + ' was successfully updated!')
+    except InvalidLocation:
+        flash('Latitude and longitude must be given together, '
+              'as valid coordinates.', 'error')
+        return redirect(url_for('edit_venue', venue_id=venue_id))
+    except VersionConflict:
+        flash('Venue ' + values['name'] + ' was changed by someone else. '
+              'Please review the latest details and try again.', 'error')
+        return redirect(url_for('edit_venue', venue_id=venue_id))
     finally:
         db.session.close()
     return redirect(url_for('show_venue', venue_id=venue_id))
 
+
+@app.route('/venues/<int:venue_id>', methods=['PATCH'])
+def patch_venue(venue_id):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    version = body.pop('version', None)
+    values = {key: body[key] for key in VENUE_PATCH_FIELDS if key in body}
+    if (not valid_version(version) or len(values) != len(body)
+            or not valid_patch(values)):
+        abort(400)
+    try:
+        version = patch_record(Venue, venue_id, version, venue_changes(
+            venue_id, with_fingerprint(Venue, venue_id, values)))
+    except ValueError:
+        abort(400)
+    except VersionConflict:
+        return jsonify({'success': False, 'error': 409,
+                        'message': 'version conflict'}), 409
+    finally:
+        db.session.close()
+    if version is None:
+        abort(404)
+    return jsonify({'success': True, 'id': venue_id, 'version': version})
+
 #  Create Artist
 #  ----------------------------------------------------------------
 
@@ -365,6 +859,7 @@ def create_artist_submission():
     # called upon submitting the new artist listing form
     # on successful db insert, flash success
     error = False
+    exact, near = [], []
     try:
         name = request.form.get('name')
         city = request.form.get('city')
@@ -372,10 +867,16 @@ def create_artist_submission():
         phone = request.form.get('phone')
         facebook_link = request.form.get('facebook_link')
         genres = request.form.getlist('genres')
-        artist = Artist(name=name, city=city, state=state, phone=phone,
-                        facebook_link=facebook_link, genres=genres)
-        db.session.add(artist)
-        db.session.commit()
+        fingerprint = dedupe.fingerprint(name, phone, city, state)
+        keys = dedupe.blocking_keys(name, phone, city, state)
+        exact, near = find_duplicates(Artist, name, fingerprint, keys)
+        if not exact:
+            artist = Artist(name=name, city=city, state=state, phone=phone,
+                            facebook_link=facebook_link, genres=genres,
+                            fingerprint=fingerprint, blocking_keys=keys)
+            db.session.add(artist)
+            db.session.commit()
+            recent_listings.add_artist(artist.id, artist.name)
 
     except:
         db.session.rollback()
@@ -387,10 +888,13 @@ def create_artist_submission():
         # on unsuccessful db insert, flash error
         flash('An error occurred. Artist ' + name +
               ' could not be listed.', 'error')
+    elif exact:
+        flash('Artist ' + name + ' is already listed.', 'error')
     else:
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
-    return render_template('pages/home.html')
+        flash_near_duplicates(near)
+    return render_home()
 
 
 #  Shows
@@ -418,7 +922,8 @@ def create_show_submission():
     try:
         artist_id = int(request.form.get('artist_id'))
         venue_id = int(request.form.get('venue_id'))
-        start_time = request.form.get('start_time')
+        start_time = dateutil.parser.parse(request.form.get('start_time'))
+        ensure_show_partitions(start_time, 1)
         show = Show(artist_id=artist_id, venue_id=venue_id,
                     start_time=start_time)
         db.session.add(show)
@@ -436,7 +941,69 @@ def create_show_submission():
     else:
         # on successful db insert, flash success
         flash('Show was successfully listed!')
-    return render_template('pages/home.html')
+    return render_home()
+
+
+#  Show partitions
+#  ----------------------------------------------------------------
+
+shows_cli = AppGroup('shows', help='Manage the monthly partitions of the Show table.')
+app.cli.add_command(shows_cli)
+
+
+def month_start(value):
+    return datetime.datetime(value.year, value.month, 1)
+
+
+def ensure_show_partitions(start, months):
+    # CREATE TABLE IF NOT EXISTS for every month in the range, done in the database
+    db.session.execute(text('SELECT create_show_partitions(:start, :months)'),
+                       {'start': month_start(start), 'months': months})
+
+
+def show_partitions():
+    # (month, partition name) for every partition still attached to "Show"
+    rows = db.session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'Show' ORDER BY child.relname"))
+    return [(datetime.datetime.strptime(name, 'Show_%Y_%m'), name)
+            for name, in rows]
+
+
+@shows_cli.command('partition')
+@click.option('--months', default=app.config['SHOW_PARTITION_MONTHS_AHEAD'],
+              help='Number of months ahead to create partitions for.')
+def partition_shows(months):
+    """Create the Show partitions for this month and the coming months."""
+    ensure_show_partitions(datetime.datetime.now(), months + 1)
+    db.session.commit()
+    click.echo(f'Show partitions exist up to {show_partitions()[-1][1]}')
+
+
+@shows_cli.command('archive')
+@click.option('--months', default=app.config['SHOW_ARCHIVE_AFTER_MONTHS'],
+              help='Archive partitions that ended more than this many months ago.')
+@click.option('--compact', is_flag=True,
+              help='Move the rows into "ShowArchive" and drop the partition '
+                   'instead of detaching it.')
+def archive_shows(months, compact):
+    """Detach or compact the Show partitions older than the cutoff."""
+    cutoff = month_start(datetime.datetime.now()) - relativedelta(months=months)
+    for month, name in show_partitions():
+        if month >= cutoff:
+            break
+        if compact:
+            db.session.execute(text(
+                f'INSERT INTO "ShowArchive" (id, start_time, venue_id, artist_id) '
+                f'SELECT id, start_time, venue_id, artist_id FROM "{name}"'))
+            db.session.execute(text(f'DROP TABLE "{name}"'))
+            click.echo(f'Compacted {name} into ShowArchive')
+        else:
+            db.session.execute(text(f'ALTER TABLE "Show" DETACH PARTITION "{name}"'))
+            click.echo(f'Detached {name}')
+        db.session.commit()
 
 
 @app.errorhandler(404)
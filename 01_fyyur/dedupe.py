@@ -0,0 +1,92 @@
+import re
+import hashlib
+from difflib import SequenceMatcher
+
+ARTICLES = ('the', 'a', 'an')
+# how alike two normalized names inside the same block have to be
+NEAR_DUPLICATE_RATIO = 0.85
+
+
+def name_tokens(name):
+    return re.findall(r'\w+', (name or '').casefold())
+
+
+def normalize_name(name):
+    # casefolded words without punctuation or a leading article
+    tokens = name_tokens(name)
+    if len(tokens) > 1 and tokens[0] in ARTICLES:
+        tokens = tokens[1:]
+    return ' '.join(tokens)
+
+
+def phone_digits(phone):
+    return re.sub(r'\D', '', phone or '')
+
+
+def normalize_place(value):
+    return ' '.join((value or '').casefold().split())
+
+
+def fingerprint(name, phone, city, state):
+    # exact-duplicate key, stored in the hash indexed fingerprint column
+    key = '|'.join((' '.join(name_tokens(name)), phone_digits(phone),
+                    normalize_place(city), normalize_place(state)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def blocking_keys(name, phone, city, state):
+    '''
+    keys stored in the GIN indexed blocking_keys column. two listings are
+    only ever compared when they share at least one key.
+    '''
+    normalized = normalize_name(name)
+    compact = normalized.replace(' ', '')
+    city = normalize_place(city)
+    state = normalize_place(state)
+    keys = [
+        f'name:{compact}|{state}',
+        f'tokens:{" ".join(sorted(set(normalized.split())))}|{city}',
+        f'prefix:{compact[:5]}|{city}|{state}',
+    ]
+    digits = phone_digits(phone)
+    if len(digits) >= 7:
+        keys.append(f'phone:{digits[-10:]}')
+    return keys
+
+
+def is_near_duplicate(name, other_name):
+    return SequenceMatcher(None, normalize_name(name),
+                           normalize_name(other_name)).ratio() >= NEAR_DUPLICATE_RATIO
+
+
+def near_duplicate_pairs(block):
+    # pairwise check, but only inside one block of (id, name) listings
+    for index, (listing_id, name) in enumerate(block):
+        for other_id, other_name in block[index + 1:]:
+            if is_near_duplicate(name, other_name):
+                yield listing_id, other_id
+
+
+def cluster(pairs):
+    '''
+    union-find over pairs of duplicate ids, returns the clusters as sorted
+    lists of ids.
+    '''
+    parent = {}
+
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for item, other in pairs:
+        root, other_root = find(item), find(other)
+        if root != other_root:
+            parent[other_root] = root
+
+    clusters = {}
+    for item in parent:
+        clusters.setdefault(find(item), []).append(item)
+    return sorted(sorted(members) for members in clusters.values())
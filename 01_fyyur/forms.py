@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, FloatField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -88,6 +88,12 @@ class VenueForm(Form):
     image_link = StringField(
         'image_link'
     )
+    latitude = FloatField(
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
     genres = SelectMultipleField(
         # TODO implement enum restriction
         'genres', validators=[DataRequired()],
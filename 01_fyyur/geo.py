@@ -0,0 +1,77 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+# stored precision, about 4.8m x 4.8m cells
+GEOHASH_PRECISION = 9
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        if value >= middle:
+            bits = bits * 2 + 1
+            bounds[0] = middle
+        else:
+            bits = bits * 2
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    # (latitude degrees, longitude degrees) covered by one cell
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def search_precision(latitude, radius_km):
+    '''
+    the longest prefix whose cells are at least radius_km on each side, so
+    the cell holding the point and its eight neighbours cover the circle.
+    0 means the radius is too large for any prefix to help.
+    '''
+    top = min(abs(latitude) + radius_km / KM_PER_DEGREE, 90.0)
+    shrink = math.cos(math.radians(top))
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lon_span = cell_size(precision)
+        if (lat_span * KM_PER_DEGREE >= radius_km
+                and lon_span * KM_PER_DEGREE * shrink >= radius_km):
+            return precision
+    return 0
+
+
+def covering_cells(latitude, longitude, radius_km):
+    precision = search_precision(latitude, radius_km)
+    if precision == 0:
+        return []
+    lat_span, lon_span = cell_size(precision)
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        cell_latitude = min(max(latitude + lat_step * lat_span, -90.0), 90.0)
+        for lon_step in (-1, 0, 1):
+            cell_longitude = (longitude + lon_step * lon_span + 180.0) % 360.0 - 180.0
+            cells.add(encode(cell_latitude, cell_longitude, precision))
+    return sorted(cells)
+
+
+def haversine(latitude, longitude, other_latitude, other_longitude):
+    lat1, lon1, lat2, lon2 = map(math.radians, (
+        latitude, longitude, other_latitude, other_longitude))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
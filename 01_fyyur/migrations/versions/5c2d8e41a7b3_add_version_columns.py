@@ -0,0 +1,28 @@
+"""add version columns to Artist and Venue
+
+Revision ID: 5c2d8e41a7b3
+Revises: f221c9a9f238
+Create Date: 2026-10-19 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d8e41a7b3'
+down_revision = 'f221c9a9f238'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Artist', sa.Column('version', sa.Integer(),
+                                      nullable=False, server_default='1'))
+    op.add_column('Venue', sa.Column('version', sa.Integer(),
+                                     nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('Venue', 'version')
+    op.drop_column('Artist', 'version')
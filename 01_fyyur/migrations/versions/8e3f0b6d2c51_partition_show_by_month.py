@@ -0,0 +1,113 @@
+"""partition Show by month on start_time
+
+Converts "Show" into a range partitioned table with one partition per month
+of start_time (PostgreSQL 11+) and adds the "ShowArchive" table used by
+`flask shows archive --compact`. Partitions are created for the existing
+history and twelve months ahead; `flask shows partition` keeps the window
+moving.
+
+Revision ID: 8e3f0b6d2c51
+Revises: 5c2d8e41a7b3
+Create Date: 2026-10-19 10:03:17.552091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f0b6d2c51'
+down_revision = '5c2d8e41a7b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_legacy"')
+    op.execute('ALTER INDEX "Show_pkey" RENAME TO "Show_legacy_pkey"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.execute('''
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'),
+            start_time timestamp without time zone NOT NULL,
+            venue_id integer NOT NULL REFERENCES "Venue" (id),
+            artist_id integer NOT NULL REFERENCES "Artist" (id),
+            CONSTRAINT "Show_pkey" PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    ''')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    op.create_index('ix_Show_venue_id_start_time', 'Show',
+                    ['venue_id', 'start_time'])
+    op.create_index('ix_Show_artist_id_start_time', 'Show',
+                    ['artist_id', 'start_time'])
+
+    op.execute('''
+        CREATE OR REPLACE FUNCTION create_show_partitions(
+            start_month timestamp, months integer) RETURNS void AS $$
+        DECLARE
+            lower_bound timestamp;
+        BEGIN
+            FOR i IN 0..months - 1 LOOP
+                lower_bound := date_trunc('month', start_month)
+                    + i * interval '1 month';
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF "Show" '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    'Show_' || to_char(lower_bound, 'YYYY_MM'),
+                    lower_bound, lower_bound + interval '1 month');
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+        SELECT create_show_partitions(first_month, (
+            (date_part('year', last_month) - date_part('year', first_month)) * 12
+            + date_part('month', last_month) - date_part('month', first_month)
+        )::integer + 1)
+        FROM (
+            SELECT date_trunc('month', LEAST(
+                       now(), min(start_time::timestamp))) AS first_month,
+                   date_trunc('month', GREATEST(
+                       now() + interval '12 months',
+                       max(start_time::timestamp))) AS last_month
+            FROM "Show_legacy"
+        ) AS bounds
+    ''')
+    op.execute('''
+        INSERT INTO "Show" (id, start_time, venue_id, artist_id)
+        SELECT id, start_time::timestamp, venue_id, artist_id FROM "Show_legacy"
+    ''')
+    op.drop_table('Show_legacy')
+
+    op.create_table('ShowArchive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'start_time')
+    )
+
+
+def downgrade():
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+    op.execute('ALTER INDEX "Show_pkey" RENAME TO "Show_partitioned_pkey"')
+    op.create_table('Show_plain',
+    sa.Column('id', sa.Integer(), nullable=False,
+              server_default=sa.text('nextval(\'"Show_id_seq"\')')),
+    sa.Column('start_time', sa.String(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('id', name='Show_pkey')
+    )
+    op.execute('''
+        INSERT INTO "Show_plain" (id, start_time, venue_id, artist_id)
+        SELECT id, to_char(start_time, 'YYYY-MM-DD HH24:MI:SS'), venue_id, artist_id
+        FROM (SELECT * FROM "Show" UNION ALL SELECT * FROM "ShowArchive") AS shows
+    ''')
+    op.drop_table('ShowArchive')
+    op.execute('DROP TABLE "Show" CASCADE')
+    op.execute('DROP FUNCTION create_show_partitions(timestamp, integer)')
+    op.rename_table('Show_plain', 'Show')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
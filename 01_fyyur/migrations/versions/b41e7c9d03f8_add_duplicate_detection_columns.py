@@ -0,0 +1,40 @@
+"""add fingerprint and blocking_keys to Artist and Venue
+
+Existing rows are filled in by `flask dedupe backfill venues|artists`.
+
+Revision ID: b41e7c9d03f8
+Revises: 8e3f0b6d2c51
+Create Date: 2026-10-19 11:26:05.873140
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e7c9d03f8'
+down_revision = '8e3f0b6d2c51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Artist', 'Venue'):
+        op.add_column(table, sa.Column('fingerprint', sa.String(length=40),
+                                       nullable=True))
+        op.add_column(table, sa.Column('blocking_keys',
+                                       postgresql.ARRAY(sa.String()),
+                                       nullable=True))
+        op.create_index(f'ix_{table}_fingerprint', table, ['fingerprint'],
+                        postgresql_using='hash')
+        op.create_index(f'ix_{table}_blocking_keys', table, ['blocking_keys'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_index(f'ix_{table}_blocking_keys', table_name=table)
+        op.drop_index(f'ix_{table}_fingerprint', table_name=table)
+        op.drop_column(table, 'blocking_keys')
+        op.drop_column(table, 'fingerprint')
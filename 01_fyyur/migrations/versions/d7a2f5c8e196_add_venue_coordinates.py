@@ -0,0 +1,35 @@
+"""add latitude, longitude and geohash to Venue
+
+geohash uses the "C" collation so the prefix range scans done by
+/venues/nearby can use the btree index.
+
+Revision ID: d7a2f5c8e196
+Revises: b41e7c9d03f8
+Create Date: 2026-10-19 12:40:52.310447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2f5c8e196'
+down_revision = 'b41e7c9d03f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash',
+                                     sa.String(length=12, collation='C'),
+                                     nullable=True))
+    op.create_index('ix_Venue_geohash', 'Venue', ['geohash'])
+
+
+def downgrade():
+    op.drop_index('ix_Venue_geohash', table_name='Venue')
+    op.drop_column('Venue', 'geohash')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
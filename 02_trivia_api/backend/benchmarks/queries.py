@@ -0,0 +1,77 @@
+'''
+CPU time per call of the hot queries, built with the Query API on every
+call as before, against the baked statements of flaskr.queries executed
+with new parameters. needs the configured trivia database with questions.
+run from the backend folder with: python -m benchmarks.queries
+'''
+import time
+
+from sqlalchemy import func
+
+from models import db, Question
+import flaskr
+from flaskr import queries
+from flaskr.serialize import QUESTION_COLUMNS
+
+CALLS = 2000
+REPEAT = 5
+PAGE_SIZE = 10
+
+
+def cpu_per_call(function):
+    # best of REPEAT runs, in microseconds of process CPU time
+    best = None
+    for _ in range(REPEAT):
+        started = time.process_time()
+        for _ in range(CALLS):
+            function()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / CALLS * 1e6
+
+
+def main():
+    app = flaskr.create_app()
+    with app.app_context():
+        question_id, category = db.session.query(
+            Question.id, Question.category).order_by(Question.id).first()
+        ids = [question_id for question_id, in db.session.query(
+            Question.id).order_by(Question.id).limit(PAGE_SIZE)]
+        cases = [
+            ('list page',
+             lambda: Question.query.order_by(Question.id).with_entities(
+                 *QUESTION_COLUMNS).offset(PAGE_SIZE).limit(PAGE_SIZE).all(),
+             lambda: queries.question_page(None, PAGE_SIZE, offset=PAGE_SIZE)),
+            ('category page',
+             lambda: Question.query.filter(
+                 Question.category == category).order_by(
+                 Question.id).with_entities(*QUESTION_COLUMNS).offset(
+                 0).limit(PAGE_SIZE).all(),
+             lambda: queries.question_page(category, PAGE_SIZE)),
+            ('count',
+             lambda: db.session.query(func.count(Question.id)).filter(
+                 Question.category == category).scalar(),
+             lambda: queries.question_count(category)),
+            # a request starts with an empty session, so Query.get()
+            # would always select too
+            ('quiz pick',
+             lambda: Question.query.filter(
+                 Question.id == question_id).one().format(),
+             lambda: queries.question_row(question_id).format()),
+            ('search rows',
+             lambda: [question.format() for question in
+                      Question.query.filter(Question.id.in_(ids))],
+             lambda: [question.format() for question in
+                      queries.question_rows(ids).values()]),
+        ]
+        print(f'CPU per call, best of {REPEAT} x {CALLS} calls')
+        print(f'{"":<16}{"Query API":>12}{"baked":>12}{"saved":>10}')
+        for name, built, baked in cases:
+            before = cpu_per_call(built)
+            after = cpu_per_call(baked)
+            print(f'{name:<16}{before:9.1f} us{after:9.1f} us'
+                  f'{(1 - after / before) * 100:9.0f}%')
+
+
+if __name__ == '__main__':
+    main()
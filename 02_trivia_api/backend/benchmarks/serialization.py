@@ -0,0 +1,59 @@
+'''
+compares the list response paths at 10k questions:
+Question.format() + jsonify against encoding the selected tuples.
+run from the backend folder with: python -m benchmarks.serialization
+'''
+import timeit
+from flask import Flask, jsonify
+
+from models import Question
+from flaskr import serialize
+
+ROWS = 10000
+REPEAT = 5
+
+
+def sample_rows():
+    return [(question_id, f'What is question number {question_id}?',
+             f'Answer "{question_id}"', question_id % 6 + 1,
+             question_id % 5 + 1) for question_id in range(1, ROWS + 1)]
+
+
+def sample_questions(rows):
+    questions = []
+    for question_id, question, answer, category, difficulty in rows:
+        question = Question(question, answer, category, difficulty)
+        question.id = question_id
+        questions.append(question)
+    return questions
+
+
+def best_of(function):
+    return min(timeit.repeat(function, number=1, repeat=REPEAT)) * 1000
+
+
+def main():
+    app = Flask(__name__)
+    rows = sample_rows()
+    questions = sample_questions(rows)
+    with app.test_request_context():
+        results = [
+            ('format() + jsonify', best_of(lambda: jsonify({
+                'success': True,
+                'questions': [question.format() for question in questions]
+            }).get_data())),
+            ('tuples -> bytes', best_of(lambda: serialize.questions_response(
+                rows, success=True).get_data())),
+            ('streamed JSON array', best_of(lambda: b''.join(
+                serialize.stream_questions(rows)))),
+            ('streamed JSON Lines', best_of(lambda: b''.join(
+                serialize.stream_questions(rows, lines=True)))),
+        ]
+    print(f'{ROWS} questions, best of {REPEAT}, encoder: '
+          f'{"orjson" if serialize.orjson else "json"}')
+    for name, milliseconds in results:
+        print(f'{name:<24}{milliseconds:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
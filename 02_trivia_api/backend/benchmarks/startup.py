@@ -0,0 +1,38 @@
+'''
+time of create_app(), against create_app() followed by the create_all()
+it used to run, and by the optional warm up. the last two need the
+configured trivia database.
+run from the backend folder with: python -m benchmarks.startup
+'''
+import timeit
+
+from models import db
+import flaskr
+
+REPEAT = 20
+
+
+def create_app():
+    return flaskr.create_app()
+
+
+def create_app_and_schema():
+    app = flaskr.create_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def create_app_and_warm_up():
+    return flaskr.create_app({'WARM_UP': True})
+
+
+def main():
+    for run in (create_app, create_app_and_schema, create_app_and_warm_up):
+        times = timeit.repeat(run, number=1, repeat=REPEAT)
+        print(f'{run.__name__:<24}best {min(times) * 1000:7.2f} ms'
+              f'   first {times[0] * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''
+bytes on the wire and round trips of the question list and quiz flows,
+with and without preflight caching and compression, as a browser on
+another origin would send them. needs the configured trivia database.
+run from the backend folder with: python -m benchmarks.transport
+'''
+import gzip
+import json
+import time
+
+from flaskr import create_app
+from flaskr.compress import brotli
+
+ORIGIN = 'http://localhost:3000'
+HEADERS = {'Origin': ORIGIN, 'Accept-Encoding': 'gzip, deflate, br'}
+CONFIGS = [
+    ('no preflight cache, identity', {'CORS_MAX_AGE': 0,
+                                      'COMPRESS_MIMETYPES': ()}),
+    ('preflight cache, compressed', {}),
+]
+
+
+class Browser:
+    '''
+    sends the preflight a browser would send before every JSON POST
+    and DELETE, unless an earlier one for the same request is still
+    fresh under its Access-Control-Max-Age
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self.preflights = {}
+        self.round_trips = 0
+        self.bytes = 0
+
+    def count(self, response):
+        self.round_trips += 1
+        self.bytes += len(response.get_data()) + sum(
+            len(f'{name}: {value}\r\n') for name, value in response.headers)
+
+    def request(self, method, path, body=None):
+        if method in ('POST', 'PATCH', 'DELETE'):
+            key = (method, path)
+            if self.preflights.get(key, 0) <= time.monotonic():
+                response = self.client.options(path, headers={
+                    **HEADERS,
+                    'Access-Control-Request-Method': method,
+                    'Access-Control-Request-Headers': 'content-type'})
+                self.count(response)
+                max_age = int(response.headers.get(
+                    'Access-Control-Max-Age', 0))
+                self.preflights[key] = time.monotonic() + max_age
+        response = self.client.open(path, method=method, json=body,
+                                    headers=HEADERS)
+        self.count(response)
+        return decode(response)
+
+
+def decode(response):
+    body = response.get_data()
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif encoding == 'br':
+        body = brotli.decompress(body)
+    return json.loads(body) if body else None
+
+
+def question_list_flow(browser):
+    browser.request('GET', '/categories')
+    for page in (1, 2, 3):
+        browser.request('GET', f'/questions?page={page}')
+    browser.request('GET', '/categories/1/questions')
+    for term in ('title', 'what', 'who'):
+        browser.request('POST', '/questions', {'searchTerm': term})
+
+
+def quiz_flow(browser):
+    browser.request('GET', '/categories')
+    previous_questions = []
+    for _ in range(5):
+        data = browser.request('POST', '/quizzes', {
+            'quiz_category': {'type': 'click', 'id': 0},
+            'previous_questions': previous_questions})
+        if not data or not data.get('question'):
+            break
+        previous_questions.append(data['question']['id'])
+
+
+def main():
+    for name, config in CONFIGS:
+        app = create_app(config)
+        for flow in (question_list_flow, quiz_flow):
+            browser = Browser(app.test_client())
+            flow(browser)
+            print(f'{flow.__name__:<20}{name:<32}'
+                  f'{browser.round_trips:4d} round trips'
+                  f'{browser.bytes:8d} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,596 @@
 import os
-from flask import Flask, request, abort, jsonify
+import hmac
+import math
+import time
+import atexit
+import weakref
+from threading import Lock, Thread
+from bisect import bisect_right
+from flask import (Flask, Response, request, abort, jsonify, g,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import (setup_db, db, on_question_change, on_category_change,
+                    Question, Category)
+from .cache import (ResultCache, LRUCache, TieredCache,
+                    cached_json_response)
+from .quiz import (QuestionPool, QuizSessions, quiz_category_id,
+                   target_difficulty, nearest_difficulties)
+from .store import store_from_url
+from .search import PostgresSearch, InvertedIndex
+from .bulk import import_questions, update_questions, read_jsonl
+from .cli import trivia_cli
+from .scores import ScoreBoard
+from .compress import compress_response
+from .snapshot import QuestionSnapshot, SnapshotPool
+from .profiling import RequestProfiler, MODES
+from .duplicates import DuplicateIndex, DUPLICATE_THRESHOLD
+from .grading import AnswerKey, MAX_GRADED_ANSWERS
+from .limits import TokenBuckets, AdmissionControl
+from .serialize import (QUESTION_COLUMNS, dumps, questions_body,
+                        questions_response, stream_questions)
+from .queries import question_page, question_count
 
 QUESTIONS_PER_PAGE = 10
+# how long a cached COUNT may be served when other workers write questions
+# and there is no shared read cache; with one, a new generation drops it
+QUESTION_COUNT_TTL = 30
+QUESTION_POOL_TTL = 300
+QUIZ_SESSION_TTL = 2 * 60 * 60
+QUIZ_DECK_REUSE = 5 * 60
+# pending players, or seconds, before quiz scores are flushed
+SCORE_FLUSH_SIZE = 500
+SCORE_FLUSH_INTERVAL = 10
+SCORE_TOTALS_TTL = 60
+LEADERBOARD_SIZE = 100
+
+
+question_counts = ResultCache(QUESTION_COUNT_TTL)
+
+
+def count_questions(category=None):
+    '''
+    COUNT of questions in a category (None for all questions),
+    cached until a question changes
+    '''
+    return question_counts.get(category, lambda: question_count(category))
+
+
+@on_question_change
+def update_question_counts(action, question):
+    # inserts and deletes shift the cached counts instead of dropping them
+    if action == 'update':
+        question_counts.invalidate()
+        return
+    delta = 1 if action == 'insert' else -1
+    for category in {None, question.category}:
+        question_counts.adjust(category, delta)
+
+
+def categories_body():
+    categories = Category.query.order_by(Category.id).all()
+    return dumps({
+        'success': True,
+        'categories': [category.format() for category in categories]
+    })
+
+
+def category_stats():
+    '''
+    question count and difficulty distribution of every category,
+    aggregated by a single GROUP BY over the category index
+    '''
+    rows = db.session.query(
+        Category.id, Category.type, Question.difficulty,
+        func.count(Question.id)).outerjoin(
+        Question, Question.category == Category.id).group_by(
+        Category.id, Category.type, Question.difficulty).order_by(
+        Category.id, Question.difficulty)
+    stats = {}
+    for category_id, category_type, difficulty, count in rows:
+        category = stats.setdefault(category_id, {
+            'id': category_id,
+            'type': category_type,
+            'totalQuestions': 0,
+            'difficulties': {}
+        })
+        # the outer join yields one NULL difficulty row for empty categories
+        if count:
+            category['totalQuestions'] += count
+            category['difficulties'][str(difficulty)] = count
+    return list(stats.values())
+
+
+def app_listeners(app):
+    '''
+    the question and category listeners of one app's indexes and caches.
+    they live in app.extensions rather than the module level lists, so
+    an app that is dropped does not stay alive, or keep being notified.
+    '''
+    return app.extensions.setdefault(
+        'trivia_listeners', {'question': [], 'category': []})
+
+
+@on_question_change
+def notify_app_question_listeners(action, question):
+    # the app whose session committed the change
+    for listener in app_listeners(db.get_app())['question']:
+        listener(action, question)
+
+
+@on_category_change
+def notify_app_category_listeners(action, category):
+    for listener in app_listeners(db.get_app())['category']:
+        listener(action, category)
+
+
+# apps whose pending scores are written when the worker stops. the set
+# is weak, so it does not keep apps that were dropped alive
+score_apps = weakref.WeakSet()
+
+
+score_flusher_lock = Lock()
+score_flusher = None
+
+
+@atexit.register
+def flush_scores():
+    for app in list(score_apps):
+        with app.app_context():
+            app.extensions['scoreboard'].flush()
+
+
+def flush_due_scores():
+    # the pending scores of apps that have not flushed for an interval,
+    # so a worker that goes quiet still writes them
+    for app in list(score_apps):
+        with app.app_context():
+            try:
+                app.extensions['scoreboard'].flush_if_due()
+            except SQLAlchemyError:
+                app.logger.exception('flushing quiz scores failed')
+
+
+def run_score_flusher():
+    while True:
+        time.sleep(SCORE_FLUSH_INTERVAL)
+        flush_due_scores()
+
+
+def start_score_flusher():
+    # one daemon thread per process, for every app
+    global score_flusher
+    with score_flusher_lock:
+        if score_flusher is None:
+            score_flusher = Thread(target=run_score_flusher,
+                                   name='score-flusher', daemon=True)
+            score_flusher.start()
+
+
+question_pool = QuestionPool(QUESTION_POOL_TTL)
+on_question_change(question_pool.on_question_change)
+answer_key = AnswerKey()
+on_question_change(answer_key.on_question_change)
+
+
+def warm_up(read_cache, duplicate_index=None):
+    '''
+    primes the categories payload, the quiz id pools of every category
+    and the duplicate index, so the first requests a worker serves do
+    not pay for them. needs an app context.
+    '''
+    read_cache.get('categories', categories_body)
+    if duplicate_index is not None:
+        duplicate_index.build()
+    question_pool.load(None)
+    for category_id, in db.session.query(Category.id):
+        question_pool.load(category_id)
+
+
+def paginate_questions(request, category=None):
+    '''
+    the requested page of the questions of a category (None for all
+    questions) by id, selected in SQL by OFFSET or, with ?after_id=, by
+    keyset, as (id, question, answer, category, difficulty) tuples
+    '''
+    after_id = request.args.get('after_id', None, type=int)
+    if after_id is not None:
+        return question_page(category, QUESTIONS_PER_PAGE, after_id=after_id)
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        return []
+    return question_page(category, QUESTIONS_PER_PAGE,
+                         offset=(page - 1) * QUESTIONS_PER_PAGE)
+
+
+def mutation_response(request, **fields):
+    '''
+    the id of the created or deleted question and the new total; the
+    refreshed page of questions is only selected with ?include_questions=true
+    '''
+    response = {'success': True, **fields, 'totalQuestions': count_questions()}
+    if request.args.get('include_questions', '').lower() in ('1', 'true'):
+        return questions_response(paginate_questions(request), **response)
+    return jsonify(response)
+
+
+def quiz_response(pool, body):
+    '''
+    a random question of the posted quiz_category drawn from `pool`,
+    skipping previous_questions; with adaptive set, from the target
+    difficulty or the nearest one with an unseen question
+    '''
+    try:
+        quiz_category = quiz_category_id(body.get('quiz_category'))
+    except ValueError:
+        abort(404)
+    previous_questions = body.get('previous_questions', [])
+    if not body.get('adaptive'):
+        question = pool.draw(quiz_category, previous_questions)
+        if question is None:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'question': question.format()
+        })
+
+    recent_answers = body.get('recent_answers', [])
+    if not isinstance(recent_answers, list):
+        abort(422)
+    target = target_difficulty(recent_answers, body.get('difficulty'))
+    for difficulty in nearest_difficulties(target):
+        question = pool.draw(quiz_category, previous_questions, difficulty)
+        if question is not None:
+            break
+    else:
+        abort(404)
+    return jsonify({
+        'success': True,
+        'question': question.format(),
+        'targetDifficulty': target
+    })
+
+
+def register_error_handlers(app):
+    '''
+    error handlers for all expected errors
+    including 404 and 422.
+    '''
+    @app.errorhandler(401)
+    def unauthorized(error):
+        return jsonify({
+            "success": False,
+            "error": 401,
+            "message": "unauthorized"
+        }), 401
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify({
+            "success": False,
+            "error": 404,
+            "message": "resource not found"
+        }), 404
+
+    @app.errorhandler(422)
+    def unprocessable(error):
+        return jsonify({
+            "success": False,
+            "error": 422,
+            "message": "unprocessable"
+        }), 422
+
+
+def serve_profiler(app, token):
+    '''
+    the /debug/profile endpoints, which profile the next requests
+    matching a path pattern, for clients sending the PROFILE_TOKEN as
+    a bearer token
+    '''
+    profiler = RequestProfiler()
+
+    @app.before_request
+    def start_profile():
+        profiler.start(request.path)
+
+    app.teardown_request(profiler.stop)
+
+    def authorize():
+        scheme, _, sent = request.headers.get(
+            'Authorization', '').partition(' ')
+        # compared as bytes: compare_digest refuses non-ASCII str
+        if scheme != 'Bearer' or not hmac.compare_digest(
+                sent.encode('utf-8'), token.encode('utf-8')):
+            abort(401)
+
+    @app.route('/debug/profile', methods=['POST'])
+    def arm_profile():
+        authorize()
+        body = request.get_json() or {}
+        pattern = body.get('pattern')
+        count = body.get('requests', 10)
+        mode = body.get('mode', 'cprofile')
+        interval = body.get('interval', 0.005)
+        if (not isinstance(pattern, str) or pattern.startswith('/debug/')
+                or not isinstance(count, int) or count < 1
+                or mode not in MODES
+                or not isinstance(interval, (int, float)) or interval <= 0):
+            abort(422)
+        profiler.arm(pattern, count, mode, interval)
+        return jsonify({'success': True, **profiler.status()})
+
+    @app.route('/debug/profile')
+    def retrieve_profile_status():
+        authorize()
+        return jsonify({'success': True, **profiler.status()})
+
+    @app.route('/debug/profile/result')
+    def retrieve_profile_result():
+        authorize()
+        try:
+            output, body = profiler.result(request.args.get('format'))
+        except ValueError:
+            abort(422)
+        response = Response(body, mimetype='application/octet-stream'
+                            if output == 'pstats' else 'text/plain')
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename=trivia-profile.{output}')
+        return response
+
+    @app.route('/debug/profile', methods=['DELETE'])
+    def disarm_profile():
+        authorize()
+        profiler.disarm()
+        return jsonify({'success': True, **profiler.status()})
+
+
+def limit_requests(app):
+    '''
+    per client token buckets for the routes in RATE_LIMITS, answering
+    429 with Retry-After, and a cap of CONCURRENCY_LIMIT requests in
+    progress with a bounded wait queue, answering 503. GET /limits/stats
+    reports their counters and is never limited.
+    '''
+    buckets = {endpoint: TokenBuckets(rate, burst) for endpoint, (rate, burst)
+               in app.config['RATE_LIMITS'].items()}
+    admission = AdmissionControl(
+        app.config['CONCURRENCY_LIMIT'], app.config['CONCURRENCY_QUEUE'],
+        app.config['CONCURRENCY_TIMEOUT']) if app.config[
+        'CONCURRENCY_LIMIT'] else None
+
+    def refuse(status, message, retry_after):
+        response = jsonify({
+            "success": False,
+            "error": status,
+            "message": message
+        })
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    @app.before_request
+    def admit_request():
+        if (request.method == 'OPTIONS'
+                or request.endpoint == 'retrieve_limit_stats'):
+            return None
+        limit = buckets.get(request.endpoint)
+        if limit is not None:
+            retry_after = limit.take(request.remote_addr)
+            if retry_after:
+                return refuse(429, 'too many requests', retry_after)
+        if admission is not None:
+            if not admission.acquire():
+                return refuse(503, 'service unavailable',
+                              admission.timeout)
+            g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(error=None):
+        if g.pop('admitted', False):
+            admission.release()
+
+    @app.route('/limits/stats')
+    def retrieve_limit_stats():
+        return jsonify({
+            'success': True,
+            'routes': {endpoint: limit.stats()
+                       for endpoint, limit in buckets.items()},
+            'concurrency': admission.stats() if admission else None
+        })
+
+
+def serve_snapshot(app, snapshots):
+    '''
+    the read only routes of a database-less worker: categories, question
+    lists and quizzes, served from the memory-mapped snapshot
+    '''
+    pool = SnapshotPool(snapshots)
+
+    @app.route('/categories')
+    def retrieve_categories():
+        body, etag = snapshots.current().categories_payload
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def page_of(ids):
+        after_id = request.args.get('after_id', None, type=int)
+        if after_id is not None:
+            start = bisect_right(ids, after_id)
+        else:
+            page = request.args.get('page', 1, type=int)
+            if page < 1:
+                return []
+            start = (page - 1) * QUESTIONS_PER_PAGE
+        snapshot = snapshots.current()
+        return [snapshot.get(question_id)
+                for question_id in ids[start:start + QUESTIONS_PER_PAGE]]
+
+    @app.route('/questions')
+    def retrieve_questions():
+        ids = snapshots.current().category_ids(None)
+        wanted_questions = page_of(ids)
+        if len(wanted_questions) == 0:
+            abort(404)
+        return questions_response(
+            wanted_questions,
+            success=True,
+            totalQuestions=len(ids),
+            categories=list({question.category
+                             for question in wanted_questions}))
+
+    @app.route('/categories/<int:category_id>/questions')
+    def retrieve_category_questions(category_id):
+        ids = snapshots.current().category_ids(category_id)
+        wanted_questions = page_of(ids)
+        if len(wanted_questions) == 0:
+            abort(404)
+        return questions_response(
+            wanted_questions,
+            success=True,
+            totalQuestions=len(ids))
+
+    @app.route('/quizzes', methods=['POST'])
+    def random_question():
+        return quiz_response(pool, request.get_json())
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    app.config.from_mapping(
+        # None keeps quiz sessions in process, redis://... shares them
+        QUIZ_SESSION_STORE_URL=os.environ.get('QUIZ_SESSION_STORE_URL'),
+        # 'postgres' or 'memory', None picks by database
+        SEARCH_BACKEND=os.environ.get('SEARCH_BACKEND'),
+        SEARCH_INDEX_PATH=os.environ.get('SEARCH_INDEX_PATH'),
+        # seconds browsers may reuse a preflight answer, 0 disables it
+        CORS_MAX_AGE=int(os.environ.get('CORS_MAX_AGE', 7200)),
+        # bodies smaller than this are not worth compressing
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_MIMETYPES=('application/json', 'application/x-ndjson'),
+        COMPRESS_GZIP_LEVEL=6,
+        COMPRESS_BROTLI_QUALITY=5,
+        # prime caches in create_app, before the worker takes requests
+        WARM_UP=os.environ.get('WARM_UP', '').lower() in ('1', 'true'),
+        # serve reads from this `flask trivia snapshot` file, without a
+        # database; the file is checked for a new snapshot every interval
+        SNAPSHOT_PATH=os.environ.get('SNAPSHOT_PATH'),
+        SNAPSHOT_CHECK_INTERVAL=1,
+        # encoded read responses kept per worker, and in the shared store
+        # at READ_CACHE_URL (memory:// for the in-process stand-in).
+        # without a shared store other workers see a change only once
+        # their copy expires, after up to READ_CACHE_TTL seconds; with
+        # one, after up to READ_CACHE_GENERATION_TTL seconds
+        READ_CACHE_SIZE=1024,
+        READ_CACHE_TTL=60,
+        READ_CACHE_URL=os.environ.get('READ_CACHE_URL'),
+        READ_CACHE_SHARED_TTL=300,
+        READ_CACHE_GENERATION_TTL=1,
+        # bearer token of the /debug/profile endpoints, None disables them
+        PROFILE_TOKEN=os.environ.get('PROFILE_TOKEN'),
+        # 'warn' lists near-duplicates of a created question, 'reject'
+        # refuses it unless allowDuplicate is posted, 'off' skips the check.
+        # the index is built by WARM_UP or after the first request, in a
+        # thread; until it is done 'warn' answers duplicatesChecked false
+        # and 'reject' waits for it
+        DUPLICATE_POLICY=os.environ.get('DUPLICATE_POLICY', 'warn'),
+        DUPLICATE_THRESHOLD=DUPLICATE_THRESHOLD,
+        DUPLICATE_INDEX_PATH=os.environ.get('DUPLICATE_INDEX_PATH'),
+        # (requests per second, burst) per client for each endpoint
+        RATE_LIMITS={
+            'create_or_search_question': (10, 20),
+            'random_question': (20, 40),
+        },
+        # requests in progress per worker, 0 for no limit, and how many
+        # may wait for how long before getting a 503
+        CONCURRENCY_LIMIT=int(os.environ.get('CONCURRENCY_LIMIT', 32)),
+        CONCURRENCY_QUEUE=64,
+        CONCURRENCY_TIMEOUT=0.5,
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
     setup_db(app)
+    listeners = app_listeners(app)
+    quiz_sessions = QuizSessions(
+        store_from_url(app.config['QUIZ_SESSION_STORE_URL']),
+        question_pool, QUIZ_SESSION_TTL, QUIZ_DECK_REUSE)
+    search_backend = app.config['SEARCH_BACKEND']
+    if search_backend is None:
+        search_backend = 'postgres' if app.config[
+            'SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'memory'
+    if search_backend == 'postgres':
+        question_search = PostgresSearch()
+    else:
+        question_search = InvertedIndex(app.config['SEARCH_INDEX_PATH'])
+        listeners['question'].append(question_search.on_question_change)
+    app.cli.add_command(trivia_cli)
+    read_cache = TieredCache(
+        LRUCache(app.config['READ_CACHE_SIZE'], app.config['READ_CACHE_TTL']),
+        store_from_url(app.config['READ_CACHE_URL'])
+        if app.config['READ_CACHE_URL'] else None,
+        app.config['READ_CACHE_SHARED_TTL'],
+        app.config['READ_CACHE_GENERATION_TTL'])
+    listeners['question'].append(read_cache.bump)
+    listeners['category'].append(read_cache.bump)
+    app.teardown_request(read_cache.end_request)
+    # counts cached by this worker may miss other workers' changes
+    read_cache.on_new_generation(question_counts.invalidate)
+    app.extensions['read_cache'] = read_cache
+    scoreboard = ScoreBoard(SCORE_FLUSH_SIZE, SCORE_FLUSH_INTERVAL,
+                            SCORE_TOTALS_TTL, LEADERBOARD_SIZE)
+    app.extensions['scoreboard'] = scoreboard
+    score_apps.add(app)
+    start_score_flusher()
 
     '''
     Set up CORS. Allow '*' for origins.
     Delete the sample route after completing the TODOs
     '''
-    CORS(app, resources={r"*": {"origins": "*"}})
+    CORS(app, resources={r"*": {"origins": "*"}},
+         max_age=app.config['CORS_MAX_AGE'] or None)
     '''
     the after_request decorator to set Access-Control-Allow
+    and compress the response body
     '''
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Headers',
                              'Content-Type, Authorization')
         response.headers.add('Access-Control-Allow-Methods',
-                             'GET, POST, DELETE, OPTIONS')
-        return response
+                             'GET, POST, PATCH, DELETE, OPTIONS')
+        return compress_response(response, request, app.config)
+
+    if app.config['PROFILE_TOKEN']:
+        serve_profiler(app, app.config['PROFILE_TOKEN'])
+    limit_requests(app)
+
+    if app.config['SNAPSHOT_PATH']:
+        serve_snapshot(app, QuestionSnapshot(
+            app.config['SNAPSHOT_PATH'],
+            app.config['SNAPSHOT_CHECK_INTERVAL']))
+        register_error_handlers(app)
+        return app
+
+    # set up past the snapshot return: snapshot workers have no
+    # database to build the duplicate index from
+    duplicate_policy = app.config['DUPLICATE_POLICY']
+    if duplicate_policy != 'off':
+        duplicate_index = DuplicateIndex(app.config['DUPLICATE_INDEX_PATH'],
+                                         app.config['DUPLICATE_THRESHOLD'])
+        listeners['question'].append(duplicate_index.on_question_change)
+        app.extensions['duplicate_index'] = duplicate_index
+
+        @app.before_first_request
+        def build_duplicate_index():
+            # minhashing the whole bank is left to a thread, so no
+            # request waits for it
+            duplicate_index.build_in_background(app)
 
     '''
     an endpoint to handle GET requests
@@ -36,13 +598,28 @@ def create_app(test_config=None):
     '''
     @app.route('/categories')
     def retrieve_categories():
-        categories = Category.query.all()
-        formatted_categories = [category.format() for category in categories]
-        return jsonify(
-            {
+        return cached_json_response(read_cache, 'categories', categories_body)
+
+    '''
+    an endpoint to handle GET requests for the number of questions
+    and their difficulty distribution in every category.
+    '''
+    @app.route('/categories/stats')
+    def retrieve_category_stats():
+        def build():
+            return dumps({
                 'success': True,
-                'categories': formatted_categories
+                'categories': category_stats()
             })
+        return cached_json_response(read_cache, 'categories/stats', build)
+
+    '''
+    an endpoint to handle GET requests for the hit, miss and eviction
+    counts of the read cache.
+    '''
+    @app.route('/cache/stats')
+    def retrieve_cache_stats():
+        return jsonify({'success': True, **read_cache.stats()})
 
     '''
     an endpoint to handle GET requests for questions,
@@ -58,26 +635,32 @@ def create_app(test_config=None):
     '''
     @app.route('/questions')
     def retrieve_questions():
-        questions = Question.query.order_by(Question.id).all()
-        wanted_questions = paginate_questions(request, questions)
+        def build():
+            wanted_questions = paginate_questions(request)
 
-        if len(wanted_questions) == 0:
-            abort(404)
+            if len(wanted_questions) == 0:
+                abort(404)
 
-        categories = {question['category'] for question in wanted_questions}
-        return jsonify({
-            'success': True,
-            'questions': wanted_questions,
-            'totalQuestions': len(questions),
-            'categories': list(categories)
-        })
+            categories = {question.category for question in wanted_questions}
+            return questions_body(
+                wanted_questions,
+                success=True,
+                totalQuestions=count_questions(),
+                categories=list(categories))
+        return cached_json_response(read_cache, request.full_path, build)
 
-    def paginate_questions(request, questions):
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-        formatted_questions = [question.format() for question in questions]
-        return formatted_questions[start:end]
+    '''
+    an endpoint to export every question, streamed as a JSON array
+    or, with ?format=jsonl, as JSON Lines.
+    '''
+    @app.route('/questions/export')
+    def export_questions():
+        lines = request.args.get('format') == 'jsonl'
+        rows = db.session.query(*QUESTION_COLUMNS).order_by(
+            Question.id).yield_per(1000)
+        return Response(
+            stream_with_context(stream_questions(rows, lines)),
+            mimetype='application/x-ndjson' if lines else 'application/json')
 
     '''
     an endpoint to DELETE question using a question ID.
@@ -97,15 +680,7 @@ def create_app(test_config=None):
                 abort(404)
 
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
-
-            return jsonify({
-                'success': True,
-                'deleted':  question.id,
-                'questions': current_questions,
-                'totalQuestions': len(selection)
-            })
+            return mutation_response(request, deleted=question.id)
         except Exception:
             abort(422)
 
@@ -130,49 +705,100 @@ def create_app(test_config=None):
         search_term = body.get('searchTerm', None)
         if search_term is None:
             return create_question(
-                request, question, answer, difficulty, category)
+                request, question, answer, difficulty, category,
+                bool(body.get('allowDuplicate')))
         else:
             return search_questions(search_term)
 
-    def create_question(request, question, answer, difficulty, category):
+    def create_question(request, question, answer, difficulty, category,
+                        allow_duplicate=False):
+        duplicates = {}
+        matches = None
+        if duplicate_policy != 'off' and isinstance(question, str):
+            matches = duplicate_index.similar(question)
+            if matches is None and duplicate_policy == 'reject':
+                # no duplicate may slip in while the index is built, so
+                # this request waits for it
+                duplicate_index.build()
+                matches = duplicate_index.similar(question)
+            if matches is None:
+                # 'warn' skips the check until the index is built
+                duplicates = {'duplicatesChecked': False}
+        if matches is not None:
+            duplicates = {'duplicates': [
+                {'id': question_id, 'similarity': round(score, 2)}
+                for question_id, score in matches]}
+            if (duplicate_policy == 'reject' and duplicates['duplicates']
+                    and not allow_duplicate):
+                return jsonify({
+                    "success": False,
+                    "error": 409,
+                    "message": "duplicate question",
+                    **duplicates
+                }), 409
         try:
             question = Question(question, answer, category, difficulty)
             question.insert()
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
-            return jsonify({
-                'success': True,
-                'created': question.id,
-                'questions': current_questions,
-                'totalQuestions': len(selection)
-            })
+            return mutation_response(request, created=question.id,
+                                     **duplicates)
 
         except Exception:
             abort(422)
 
+    '''
+    batch endpoints to import and edit many questions at once.
+    POST /questions/bulk streams a JSON Lines body, one question per
+    line, and PATCH /questions takes a list of partial questions with
+    their ids; both write in batched transactions and report per row
+    errors instead of failing the whole request.
+    '''
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_create_questions():
+        report = import_questions(read_jsonl(request.stream))
+        return jsonify({'success': True, **report.format('inserted')})
+
+    @app.route('/questions', methods=['PATCH'])
+    def bulk_update_questions():
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            abort(422)
+        report = update_questions(rows)
+        return jsonify({'success': True, **report.format('updated')})
+
     '''
     a POST endpoint to get questions based on a search term.
-    It should return any questions for whom the search term
-    is a substring of the question.
+    It returns the questions whose question or answer text
+    contains every word of the search term, ranked by relevance,
+    paginated and with the matching words highlighted.
 
     TEST: Search by any phrase. The questions list will update to include
     only question that include that string within their question.
     Try using the word "title" to start.
     '''
     def search_questions(search_term):
-        current_questions = Question.query.filter(
-            Question.question.ilike('%'+search_term+'%')).all()
-
-        if len(current_questions) == 0:
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
             abort(404)
 
-        formmated_current_questions = [
-            question.format() for question in current_questions]
-        return jsonify({
-            'success': True,
-            'questions': formmated_current_questions,
-            'totalQuestions': len(current_questions)
-        })
+        def build():
+            results, total = question_search.search(
+                search_term, (page - 1) * QUESTIONS_PER_PAGE,
+                QUESTIONS_PER_PAGE)
+
+            formatted_questions = []
+            for question, highlighted, answer_highlighted in results:
+                formatted_question = question.format()
+                formatted_question['highlight'] = str(highlighted)
+                formatted_question['answerHighlight'] = str(
+                    answer_highlighted)
+                formatted_questions.append(formatted_question)
+            return dumps({
+                'success': True,
+                'questions': formatted_questions,
+                'totalQuestions': total
+            })
+        return cached_json_response(
+            read_cache, f'search:{page}:{search_term}', build)
 
     '''
     a GET endpoint to get questions based on category.
@@ -181,20 +807,19 @@ def create_app(test_config=None):
     categories in the left column will cause only questions of that
     category to be shown.
     '''
-    @app.route('/categories/<category_id>/questions')
+    @app.route('/categories/<int:category_id>/questions')
     def retrieve_category_questions(category_id):
-        questions = Question.query.filter(
-            Question.category == category_id).order_by(Question.id).all()
-        wanted_questions = paginate_questions(request, questions)
+        def build():
+            wanted_questions = paginate_questions(request, category_id)
 
-        if len(wanted_questions) == 0:
-            abort(404)
+            if len(wanted_questions) == 0:
+                abort(404)
 
-        return jsonify({
-            'success': True,
-            'questions': wanted_questions,
-            'totalQuestions': len(questions)
-        })
+            return questions_body(
+                wanted_questions,
+                success=True,
+                totalQuestions=count_questions(category_id))
+        return cached_json_response(read_cache, request.full_path, build)
 
     '''
     a POST endpoint to get questions to play the quiz.
@@ -205,43 +830,142 @@ def create_app(test_config=None):
     TEST: In the "Play" tab, after a user selects "All" or a category,
     one question at a time is displayed, the user is allowed to answer
     and shown whether they were correct or not.
+
+    with adaptive set, the question comes from a target difficulty
+    moved up or down by the player's recent answers.
     '''
     @app.route('/quizzes', methods=['POST'])
     def random_question():
-        body = request.get_json()
-        quiz_category = body.get('quiz_category')
-        previous_questions = body.get('previous_questions', [])
+        return quiz_response(question_pool, request.get_json())
+
+    '''
+    endpoints to record quiz answers and read the leaderboards.
+    scores are kept per player and category (0 for all categories)
+    and written to the database in batches.
+    '''
+    @app.route('/quizzes/answers', methods=['POST'])
+    def record_quiz_answer():
+        body = request.get_json() or {}
+        player = body.get('player')
+        if not isinstance(player, str) or not 0 < len(player) <= 80:
+            abort(422)
         try:
-            questions = Question.query.filter(
-                Question.category == quiz_category,
-                Question.category.notin_(previous_questions)).all()
-            index = random.randint(0, len(questions)-1)
-            formatted_question = questions[index].format()
-            return jsonify({
-                'success': True,
-                'question': formatted_question
-            })
-        except Exception:
+            category = quiz_category_id(body.get('quiz_category')) or 0
+        except ValueError:
             abort(404)
+        correct, answered = scoreboard.record(
+            player, category, bool(body.get('correct')))
+        return jsonify({
+            'success': True,
+            'player': player,
+            'correct': correct,
+            'answered': answered
+        })
 
     '''
-    error handlers for all expected errors
-    including 404 and 422.
+    an endpoint to grade many quiz answers at once. answers are
+    compared with Question.answer after normalization and forgive a few
+    typos; with a player they are also recorded like /quizzes/answers.
     '''
-    @app.errorhandler(404)
-    def not_found(error):
+    @app.route('/quizzes/grade', methods=['POST'])
+    def grade_quiz_answers():
+        body = request.get_json() or {}
+        answers = body.get('answers')
+        if (not isinstance(answers, list)
+                or not 0 < len(answers) <= MAX_GRADED_ANSWERS):
+            abort(422)
+        pairs = []
+        for answer in answers:
+            if (not isinstance(answer, dict)
+                    or not isinstance(answer.get('question'), int)
+                    or not isinstance(answer.get('answer'), str)):
+                abort(422)
+            pairs.append((answer['question'], answer['answer']))
+        player = body.get('player')
+        if player is not None and (
+                not isinstance(player, str) or not 0 < len(player) <= 80):
+            abort(422)
+        try:
+            category = quiz_category_id(body.get('quiz_category')) or 0
+        except ValueError:
+            abort(404)
+
+        results = answer_key.grade(pairs)
+        response = {
+            'success': True,
+            'results': results,
+            'correct': sum(result['correct'] for result in results)
+        }
+        if player is not None:
+            score = None
+            for result in results:
+                if 'error' not in result:
+                    score = scoreboard.record(player, category,
+                                              result['correct'])
+            if score is not None:
+                response['player'] = player
+                response['score'] = {'correct': score[0],
+                                     'answered': score[1]}
+        return jsonify(response)
+
+    @app.route('/quizzes/leaderboard')
+    def retrieve_leaderboard():
+        category = request.args.get('category', 0, type=int)
+        limit = min(request.args.get('limit', 10, type=int), LEADERBOARD_SIZE)
         return jsonify({
-            "success": False,
-            "error": 404,
-            "message": "resource not found"
-        }), 404
+            'success': True,
+            'category': category,
+            'leaderboard': [
+                {'player': player, 'correct': correct, 'answered': answered}
+                for player, (correct, answered) in scoreboard.leaderboard(
+                    category, max(limit, 0))]
+        })
 
-    @app.errorhandler(422)
-    def unprocessable(error):
+    '''
+    endpoints to play a quiz as a server-side session.
+    the session holds a seeded permutation of the category's question
+    ids, so the client no longer sends previous_questions and every
+    call only advances the session's cursor.
+    '''
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def start_quiz_session():
+        body = request.get_json() or {}
+        try:
+            quiz_category = quiz_category_id(body.get('quiz_category'))
+        except ValueError:
+            abort(404)
+        session_id, total = quiz_sessions.start(quiz_category)
+        if total == 0:
+            abort(404)
         return jsonify({
-            "success": False,
-            "error": 422,
-            "message": "unprocessable"
-        }), 422
+            'success': True,
+            'session_id': session_id,
+            'totalQuestions': total
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        found, question = quiz_sessions.next_question(session_id)
+        if not found:
+            abort(404)
+        return jsonify({
+            'success': True,
+            'question': question.format() if question is not None else None
+        })
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def end_quiz_session(session_id):
+        if not quiz_sessions.end(session_id):
+            abort(404)
+        return jsonify({
+            'success': True,
+            'deleted': session_id
+        })
+
+    register_error_handlers(app)
+
+    if app.config['WARM_UP']:
+        with app.app_context():
+            warm_up(read_cache, app.extensions.get('duplicate_index'))
 
     return app
@@ -0,0 +1,185 @@
+import csv
+import json
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, Category
+
+QUESTION_FIELDS = ('question', 'answer', 'category', 'difficulty')
+DIFFICULTIES = range(1, 6)
+# rows written per transaction
+BATCH_SIZE = 500
+# per-row errors listed in a report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def read_jsonl(lines):
+    # (line number, row) for every non blank line; None for invalid JSON
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def read_csv(lines):
+    # (line number, row) with the header naming the question fields
+    return enumerate(csv.DictReader(lines), 2)
+
+
+def category_ids():
+    return {category_id for category_id, in db.session.query(Category.id)}
+
+
+def clean_question(row, categories, partial=False):
+    '''
+    the question fields of a row, checked and converted. raises
+    ValueError naming the first bad field; with partial, missing fields
+    are left out instead of rejected.
+    '''
+    if not isinstance(row, dict):
+        raise ValueError('row is not a JSON object')
+    fields = {}
+    for field in QUESTION_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            if partial:
+                continue
+            raise ValueError(f'{field} is required')
+        if field in ('question', 'answer'):
+            if not isinstance(value, str):
+                raise ValueError(f'{field} must be text')
+        else:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{field} must be an integer')
+            if field == 'category' and value not in categories:
+                raise ValueError(f'category {value} does not exist')
+            if field == 'difficulty' and value not in DIFFICULTIES:
+                raise ValueError('difficulty must be between 1 and 5')
+        fields[field] = value
+    return fields
+
+
+def question_id(row):
+    try:
+        return int(row['id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('id must be an integer')
+
+
+class BatchReport:
+    '''
+    outcome of a batch write: rows written, rows failed with the first
+    MAX_REPORTED_ERRORS of their errors, and throughput
+    '''
+
+    def __init__(self):
+        self.written = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        rows = self.written + self.failed
+        return round(rows / elapsed, 1) if elapsed > 0 else float(rows)
+
+    def format(self, action):
+        return {
+            action: self.written,
+            'failed': self.failed,
+            'errors': self.errors,
+            'rowsPerSecond': self.rows_per_second
+        }
+
+
+def import_questions(rows, batch_size=BATCH_SIZE):
+    '''
+    validates (row number, row) pairs and inserts the valid ones,
+    batch_size rows per transaction
+    '''
+    report = BatchReport()
+    categories = category_ids()
+    batch = []
+    for number, row in rows:
+        try:
+            batch.append((number, clean_question(row, categories)))
+        except ValueError as error:
+            report.error(number, str(error))
+            continue
+        if len(batch) >= batch_size:
+            insert_batch(batch, report)
+            batch = []
+    if batch:
+        insert_batch(batch, report)
+    return report
+
+
+def insert_batch(batch, report):
+    try:
+        Question.insert_many([Question(**fields) for _, fields in batch])
+        report.written += len(batch)
+    except SQLAlchemyError:
+        db.session.rollback()
+        if len(batch) == 1:
+            report.error(batch[0][0], 'could not be stored')
+            return
+        # retry row by row so only the rows the database refuses fail
+        for row in batch:
+            insert_batch([row], report)
+
+
+def update_questions(rows, batch_size=BATCH_SIZE):
+    '''
+    applies a list of partial questions, each with its id, loading and
+    committing batch_size questions at a time. rows are numbered by
+    their position in the list.
+    '''
+    report = BatchReport()
+    categories = category_ids()
+    for start in range(0, len(rows), batch_size):
+        batch = list(enumerate(rows[start:start + batch_size], start))
+        ids = []
+        for _, row in batch:
+            try:
+                ids.append(question_id(row))
+            except ValueError:
+                pass
+        questions = {question.id: question for question in
+                     Question.query.filter(Question.id.in_(ids))
+                     } if ids else {}
+        changed = []
+        for number, row in batch:
+            try:
+                fields = clean_question(row, categories, partial=True)
+                question = questions.get(question_id(row))
+            except ValueError as error:
+                report.error(number, str(error))
+                continue
+            if question is None:
+                report.error(number, 'question not found')
+                continue
+            for field, value in fields.items():
+                setattr(question, field, value)
+            changed.append((number, question))
+        if not changed:
+            continue
+        try:
+            Question.update_many([question for _, question in changed])
+            report.written += len(changed)
+        except SQLAlchemyError:
+            db.session.rollback()
+            for number, _ in changed:
+                report.error(number, 'could not be stored')
+    return report
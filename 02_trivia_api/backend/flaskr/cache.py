@@ -0,0 +1,213 @@
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+from flask import Response, json, request, g, has_request_context
+
+GENERATION_KEY = 'trivia:generation'
+
+
+class ResultCache:
+    '''
+    process-level cache of computed values. a value is kept until
+    invalidate() is called, which has the model listener signature so it
+    can be registered directly, or until `ttl` seconds pass (None keeps
+    it until invalidated).
+    '''
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.values = {}
+        self.lock = Lock()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        cached = self.values.get(key)
+        if cached is not None and (cached[1] is None or cached[1] > now):
+            return cached[0]
+        value = loader()
+        with self.lock:
+            self.values[key] = (
+                value, None if self.ttl is None else now + self.ttl)
+        return value
+
+    def adjust(self, key, delta):
+        # shifts a cached number in place; nothing to do if it is not cached
+        with self.lock:
+            cached = self.values.get(key)
+            if cached is not None:
+                self.values[key] = (cached[0] + delta, cached[1])
+
+    def invalidate(self, *args):
+        with self.lock:
+            self.values.clear()
+
+
+def encode_payload(payload):
+    # serialized body and its content hash, used as the ETag
+    body = json.dumps(payload).encode('utf-8')
+    return body, hashlib.sha1(body).hexdigest()
+
+
+class LRUCache:
+    '''
+    in-process cache of at most `size` values, each kept for `ttl`
+    seconds; the least recently used value is evicted first
+    '''
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            cached = self.values.get(key)
+            if cached is not None and cached[1] > time.monotonic():
+                self.values.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            if cached is not None:
+                del self.values[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self.lock:
+            self.values[key] = (value, time.monotonic() + self.ttl)
+            self.values.move_to_end(key)
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.values)
+        }
+
+
+class TieredCache:
+    '''
+    encoded response bodies in an LRUCache in front of an optional
+    shared store (a MemoryStore stand-in or a redis client), which lets
+    workers reuse each other's pages. keys carry the question bank
+    generation, bumped by bump() on every question or category change,
+    so a change retires every cached body at once.
+
+    without a shared store the generation is per process: a worker sees
+    its own changes at once, but other workers keep serving the bodies
+    they cached before for up to the LRUCache ttl. with a shared store
+    the generation lives there and is reread every `generation_ttl`
+    seconds, which bounds how stale another worker's pages can be.
+    values a page is built from that are cached on their own, like the
+    question counts, register with on_new_generation() to be dropped
+    when another worker's change is seen, so no stale page is stored
+    under the new generation.
+    '''
+
+    def __init__(self, local, shared=None, shared_ttl=None,
+                 generation_ttl=1):
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.generation_ttl = generation_ttl
+        self.local_generation = 0
+        self.generation_expires = 0
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.generation_listeners = []
+
+    def on_new_generation(self, listener):
+        # listener() is called when the shared generation moves on
+        self.generation_listeners.append(listener)
+        return listener
+
+    def generation(self):
+        if self.shared is None:
+            return self.local_generation
+        now = time.monotonic()
+        if now >= self.generation_expires:
+            self.set_generation(int(self.shared.get(GENERATION_KEY) or 0))
+            self.generation_expires = now + self.generation_ttl
+        return self.local_generation
+
+    def set_generation(self, generation):
+        if generation != self.local_generation:
+            self.local_generation = generation
+            for listener in self.generation_listeners:
+                listener()
+
+    def bump(self, *args):
+        '''
+        retires every cached body. the changes made by a request, a bulk
+        import of many rows say, are bumped once when it ends; see
+        end_request
+        '''
+        if has_request_context():
+            g.read_cache_bump = True
+        else:
+            self.bump_now()
+
+    def bump_now(self):
+        if self.shared is None:
+            self.local_generation += 1
+        else:
+            self.set_generation(int(self.shared.incr(GENERATION_KEY)))
+            self.generation_expires = time.monotonic() + self.generation_ttl
+
+    def end_request(self, error=None):
+        # registered with teardown_request, so it runs even on errors
+        if g.pop('read_cache_bump', False):
+            self.bump_now()
+
+    def get(self, key, loader):
+        key = f'trivia:cache:{self.generation()}:{key}'
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value)
+                return value
+            self.shared_misses += 1
+        value = loader()
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, ex=self.shared_ttl)
+        return value
+
+    def stats(self):
+        return {
+            'generation': self.generation(),
+            'local': self.local.stats(),
+            'shared': None if self.shared is None else {
+                'hits': self.shared_hits,
+                'misses': self.shared_misses
+            }
+        }
+
+
+def json_body_response(body):
+    '''
+    a response of the encoded JSON body, answering 304 Not Modified
+    when the client already holds the same ETag
+    '''
+    response = Response(body, mimetype='application/json')
+    response.set_etag(hashlib.sha1(body).hexdigest())
+    # let clients keep the payload but revalidate it on every use
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def cached_json_response(cache, key, build):
+    # the JSON body built by build() as bytes, from the cache
+    return json_body_response(cache.get(key, build))
@@ -0,0 +1,66 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from models import db, Question
+from .bulk import BATCH_SIZE, import_questions, read_csv, read_jsonl
+from .snapshot import write_snapshot
+from .duplicates import DuplicateIndex
+
+trivia_cli = AppGroup('trivia', help='Manage the trivia question bank.')
+
+
+@trivia_cli.command('init-db')
+def init_db_command():
+    '''Create the tables and indexes that do not exist yet.'''
+    db.create_all()
+    click.echo('trivia schema created')
+
+
+@trivia_cli.command('import')
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'file_format', type=click.Choice(['jsonl', 'csv']),
+              help='Defaults to csv for .csv files and jsonl otherwise.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True,
+              help='Questions inserted per transaction.')
+def import_command(source, file_format, batch_size):
+    '''Import questions from a JSON Lines or CSV file ("-" for stdin).'''
+    if file_format is None:
+        file_format = 'csv' if source.name.endswith('.csv') else 'jsonl'
+    rows = read_csv(source) if file_format == 'csv' else read_jsonl(source)
+    report = import_questions(rows, batch_size)
+    for error in report.errors:
+        click.echo(f'line {error["row"]}: {error["error"]}', err=True)
+    click.echo(f'{report.written} imported, {report.failed} failed, '
+               f'{report.rows_per_second} rows/s')
+
+
+@trivia_cli.command('snapshot')
+@click.argument('path', required=False)
+def snapshot_command(path):
+    '''Export questions and categories for database-less serving.'''
+    path = path or current_app.config['SNAPSHOT_PATH']
+    if not path:
+        raise click.UsageError('give a PATH or set SNAPSHOT_PATH')
+    categories, questions = write_snapshot(path)
+    click.echo(f'{path}: {categories} categories, {questions} questions')
+
+
+@trivia_cli.command('duplicates')
+@click.option('--threshold', type=float,
+              help='Similarity at which questions are duplicates; '
+                   'defaults to DUPLICATE_THRESHOLD.')
+def duplicates_command(threshold):
+    '''List the clusters of near-duplicate questions in the bank.'''
+    index = DuplicateIndex(
+        threshold=threshold or current_app.config['DUPLICATE_THRESHOLD'])
+    clusters = index.clusters()
+    questions = dict(db.session.query(Question.id, Question.question).filter(
+        Question.id.in_([question_id for cluster in clusters
+                         for question_id in cluster]))) if clusters else {}
+    for cluster in clusters:
+        click.echo(f'{len(cluster)} questions:')
+        for question_id in cluster:
+            click.echo(f'  {question_id}: {questions.get(question_id)}')
+    click.echo(f'{len(clusters)} clusters, '
+               f'{sum(map(len, clusters))} questions')
@@ -0,0 +1,49 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def choose_encoding(request):
+    # brotli when the client takes it and it is installed, else gzip
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, request, config):
+    '''
+    compresses the body of a response whose mimetype is in
+    COMPRESS_MIMETYPES and whose size reaches COMPRESS_MIN_SIZE, with
+    brotli or gzip as the client accepts. streamed, partial and already
+    encoded responses are left alone.
+    '''
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+    # the body depends on Accept-Encoding even when it is not compressed
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers):
+        return response
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < config['COMPRESS_MIN_SIZE']:
+        return response
+    if encoding == 'br':
+        body = brotli.compress(body, quality=config['COMPRESS_BROTLI_QUALITY'])
+    else:
+        body = gzip.compress(body, compresslevel=config['COMPRESS_GZIP_LEVEL'])
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # the encoded body is a different representation of the same payload
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,268 @@
+import os
+import zlib
+import pickle
+import random
+from array import array
+from threading import Lock, Thread
+from sqlalchemy import func
+
+from models import db, Question
+from .search import tokenize
+
+# MinHash signature length, split into BANDS bands of ROWS values for
+# LSH: a pair at Jaccard similarity s becomes a candidate with
+# probability 1 - (1 - s ** ROWS) ** BANDS, 0.99 at 0.7 and 0.12 at 0.3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# estimated Jaccard similarity at which two questions are duplicates
+DUPLICATE_THRESHOLD = 0.7
+MERSENNE_PRIME = (1 << 61) - 1
+# fixed seed, so snapshotted signatures stay comparable across restarts
+PERMUTATIONS = [(random.Random(seed).randrange(1, MERSENNE_PRIME),
+                 random.Random(-seed).randrange(MERSENNE_PRIME))
+                for seed in range(1, NUM_PERM + 1)]
+
+
+def shingles(text):
+    # the words left after dropping stopwords, so a reordered or lightly
+    # reworded question keeps most of its set
+    return set(tokenize(text))
+
+
+def minhash(text):
+    '''
+    the MinHash signature of a question text as an array of NUM_PERM
+    32 bit values, or None when it has no words to compare
+    '''
+    hashes = [zlib.crc32(shingle.encode('utf-8'))
+              for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return array('I', (
+        min((a * value + b) % MERSENNE_PRIME for value in hashes) & 0xffffffff
+        for a, b in PERMUTATIONS))
+
+
+def similarity(signature, other):
+    # the share of equal values estimates the Jaccard similarity
+    return sum(a == b for a, b in zip(signature, other)) / NUM_PERM
+
+
+def band_keys(signature):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS].tobytes())
+            for band in range(BANDS)]
+
+
+class DuplicateIndex:
+    '''
+    MinHash signatures of the question texts with an LSH index of their
+    bands, so the near-duplicates of a text are found by looking up
+    BANDS buckets instead of comparing it with every question. it is
+    built by build(), or in a thread by build_in_background(), without
+    holding up lookups; changes made meanwhile are replayed once it is
+    done. it is kept current by the question listeners and snapshotted
+    to `path` like the InvertedIndex, which an update discards until the
+    next snapshot.
+    '''
+
+    def __init__(self, path=None, threshold=DUPLICATE_THRESHOLD,
+                 snapshot_every=100):
+        self.path = path
+        self.threshold = threshold
+        self.snapshot_every = snapshot_every
+        self.signatures = {}
+        self.buckets = {}
+        self.changes = 0
+        self.loaded = False
+        self.building = False
+        # changes made while the index is being built, else None
+        self.pending = None
+        self.lock = Lock()
+        self.build_lock = Lock()
+
+    def database_state(self):
+        return tuple(db.session.query(
+            func.count(Question.id), func.max(Question.id)).one())
+
+    def read_signatures(self):
+        '''
+        (signatures by id, database state) from the snapshot when it
+        matches the database, else computed from every question; the
+        state is None then, so the caller knows to save a snapshot
+        '''
+        state = self.database_state()
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'rb') as snapshot:
+                data = pickle.load(snapshot)
+            if data['state'] == state:
+                return data['signatures'], None
+        signatures = {}
+        for question_id, question in db.session.query(
+                Question.id, Question.question).yield_per(10000):
+            signature = minhash(question)
+            if signature is not None:
+                signatures[question_id] = signature
+        return signatures, state
+
+    def build(self):
+        # one build at a time: a second caller waits for the first.
+        # needs an app context
+        with self.build_lock:
+            if self.loaded:
+                return
+            with self.lock:
+                self.pending = []
+            try:
+                signatures, state = self.read_signatures()
+            except Exception:
+                with self.lock:
+                    self.pending = None
+                raise
+            with self.lock:
+                for question_id, signature in signatures.items():
+                    self.add_signature(question_id, signature)
+                for action, question_id, question in self.pending:
+                    self.remove(question_id)
+                    if action != 'delete':
+                        self.add(question_id, question)
+                self.pending = None
+                self.loaded = True
+                if state is not None:
+                    self.save(state)
+
+    def build_in_background(self, app):
+        if self.loaded or self.building:
+            return
+        self.building = True
+
+        def run():
+            try:
+                with app.app_context():
+                    self.build()
+            finally:
+                self.building = False
+
+        Thread(target=run, name='duplicate-index', daemon=True).start()
+
+    def save(self, state=None):
+        if not self.path:
+            return
+        data = {
+            'state': state or self.database_state(),
+            'signatures': self.signatures
+        }
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'wb') as snapshot:
+            pickle.dump(data, snapshot, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
+
+    def add(self, question_id, question):
+        signature = minhash(question)
+        if signature is not None:
+            self.add_signature(question_id, signature)
+
+    def add_signature(self, question_id, signature):
+        self.signatures[question_id] = signature
+        for key in band_keys(signature):
+            self.buckets.setdefault(key, set()).add(question_id)
+
+    def remove(self, question_id):
+        signature = self.signatures.pop(question_id, None)
+        if signature is None:
+            return
+        for key in band_keys(signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(question_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def discard_snapshot(self):
+        # an updated question leaves the count and highest id as they
+        # were, so a snapshot from before could not be told apart
+        if not self.path:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def on_question_change(self, action, question):
+        if action == 'update':
+            self.discard_snapshot()
+        if not self.loaded and self.pending is None:
+            return
+        question_id = question.id
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((action, question_id, question.question))
+                return
+            self.remove(question_id)
+            if action != 'delete':
+                self.add(question_id, question.question)
+            self.changes += 1
+            if self.changes % self.snapshot_every == 0:
+                self.save()
+
+    def candidates(self, signature):
+        found = set()
+        for key in band_keys(signature):
+            found.update(self.buckets.get(key, ()))
+        return found
+
+    def similar(self, question, exclude=None):
+        '''
+        (question id, similarity) of the questions whose text is at
+        least `threshold` similar to `question`, most similar first, or
+        None while the index is not built yet
+        '''
+        if not self.loaded:
+            return None
+        signature = minhash(question)
+        if signature is None:
+            return []
+        with self.lock:
+            matches = []
+            for question_id in self.candidates(signature):
+                if question_id == exclude:
+                    continue
+                score = similarity(signature, self.signatures[question_id])
+                if score >= self.threshold:
+                    matches.append((question_id, score))
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def clusters(self):
+        '''
+        the groups of near-duplicate questions in the bank, as sorted id
+        lists, largest first. pairs are only compared within the LSH
+        buckets and joined transitively.
+        '''
+        self.build()
+        with self.lock:
+            parents = {}
+
+            def root(question_id):
+                while parents.get(question_id, question_id) != question_id:
+                    parent = parents[question_id]
+                    parents[question_id] = parents.get(parent, parent)
+                    question_id = parent
+                return question_id
+
+            for bucket in self.buckets.values():
+                ids = sorted(bucket)
+                for index, first in enumerate(ids):
+                    for second in ids[index + 1:]:
+                        # pairs already joined are not compared again
+                        first_root, second_root = root(first), root(second)
+                        if first_root != second_root and similarity(
+                                self.signatures[first],
+                                self.signatures[second]) >= self.threshold:
+                            parents[second_root] = first_root
+        groups = {}
+        for question_id in parents:
+            groups.setdefault(root(question_id), set()).add(question_id)
+        for question_id, group in groups.items():
+            group.add(question_id)
+        return sorted((sorted(group) for group in groups.values()),
+                      key=lambda group: (-len(group), group[0]))
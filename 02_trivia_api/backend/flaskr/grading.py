@@ -0,0 +1,107 @@
+import re
+import unicodedata
+from threading import Lock
+
+from .queries import question_answers
+
+ARTICLES = frozenset(('a', 'an', 'the'))
+# edits forgiven per character of the expected answer, and at most
+MAX_EDIT_RATIO = 0.2
+MAX_EDITS = 3
+# answers graded per request
+MAX_GRADED_ANSWERS = 100
+
+
+def normalize_answer(text):
+    '''
+    casefolded words without accents, punctuation or articles, so
+    "The Beatles!" and "beatles" compare equal
+    '''
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(word for word in re.findall(r'\w+', text.casefold())
+                    if word not in ARTICLES)
+
+
+def edit_limit(expected):
+    return min(MAX_EDITS, int(len(expected) * MAX_EDIT_RATIO))
+
+
+def within_distance(answer, expected, limit):
+    '''
+    True when `answer` is at most `limit` insertions, deletions or
+    substitutions away from `expected`. only the diagonal band of the
+    edit distance table that can stay within the limit is filled, and
+    the scan stops as soon as a whole row exceeds it.
+    '''
+    if abs(len(answer) - len(expected)) > limit:
+        return False
+    if limit == 0 or answer == expected:
+        return answer == expected
+    over = limit + 1
+    previous = [column if column <= limit else over
+                for column in range(len(expected) + 1)]
+    for row, char in enumerate(answer, 1):
+        low = max(1, row - limit)
+        high = min(len(expected), row + limit)
+        current = [over] * (len(expected) + 1)
+        if row <= limit:
+            current[0] = row
+        for column in range(low, high + 1):
+            current[column] = min(
+                previous[column] + 1, current[column - 1] + 1,
+                previous[column - 1] + (expected[column - 1] != char))
+        if min(current[low - 1:high + 1]) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+class AnswerKey:
+    '''
+    the answer of each graded question with its normalized form, loaded
+    for all the questions of a grading request missing here in one query
+    and kept current by the question listeners
+    '''
+
+    def __init__(self):
+        self.answers = {}
+        self.lock = Lock()
+
+    def lookup(self, question_ids):
+        # (answer, normalized answer) by id, for the ids that exist
+        missing = [question_id for question_id in set(question_ids)
+                   if question_id not in self.answers]
+        loaded = {question_id: (answer, normalize_answer(answer))
+                  for question_id, answer in question_answers(missing).items()}
+        with self.lock:
+            self.answers.update(loaded)
+            return {question_id: self.answers[question_id]
+                    for question_id in question_ids
+                    if question_id in self.answers}
+
+    def on_question_change(self, action, question):
+        with self.lock:
+            self.answers.pop(question.id, None)
+
+    def grade(self, answers):
+        '''
+        grades (question id, answer) pairs; returns a result dict per
+        pair with the question, correct and the expected answer
+        '''
+        key = self.lookup([question_id for question_id, _ in answers])
+        results = []
+        for question_id, answer in answers:
+            if question_id not in key:
+                results.append({'question': question_id, 'correct': False,
+                                'error': 'question not found'})
+                continue
+            expected, normalized = key[question_id]
+            given = normalize_answer(answer)
+            results.append({
+                'question': question_id,
+                'correct': bool(given) and within_distance(
+                    given, normalized, edit_limit(normalized)),
+                'answer': expected
+            })
+        return results
@@ -0,0 +1,120 @@
+import time
+from threading import Condition, Lock
+
+# idle buckets are swept once every this many requests
+SWEEP_EVERY = 1000
+
+
+class TokenBuckets:
+    '''
+    a token bucket per client: up to `burst` requests at once, refilled
+    at `rate` requests per second. a bucket idle long enough to be full
+    again is dropped, so only recently active clients take memory.
+    '''
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.allowed = 0
+        self.limited = 0
+        self.calls = 0
+        self.lock = Lock()
+
+    def take(self, client):
+        '''
+        takes a token for `client`; returns 0 when the request may go
+        ahead, else the seconds until the next token
+        '''
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            self.calls += 1
+            if self.calls % SWEEP_EVERY == 0:
+                self.sweep(now)
+            if tokens >= 1:
+                self.buckets[client] = (tokens - 1, now)
+                self.allowed += 1
+                return 0
+            self.buckets[client] = (tokens, now)
+            self.limited += 1
+            return (1 - tokens) / self.rate
+
+    def sweep(self, now):
+        refill = self.burst / self.rate
+        for client in [client for client, (_, updated) in self.buckets.items()
+                       if now - updated >= refill]:
+            del self.buckets[client]
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'burst': self.burst,
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'clients': len(self.buckets)
+        }
+
+
+class AdmissionControl:
+    '''
+    at most `limit` requests in progress. a request over the limit
+    waits in a queue of `queue_size` for up to `timeout` seconds;
+    when the queue is full it is refused at once.
+    '''
+
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.peak = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.condition = Condition()
+
+    def acquire(self):
+        # True once admitted; the caller must release() then
+        with self.condition:
+            if self.active >= self.limit or self.waiting:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+                self.queued += 1
+                deadline = time.monotonic() + self.timeout
+                try:
+                    while self.active >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            return False
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            self.peak = max(self.peak, self.active)
+            return True
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'queueSize': self.queue_size,
+            'active': self.active,
+            'waiting': self.waiting,
+            'peak': self.peak,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'timedOut': self.timed_out
+        }
@@ -0,0 +1,167 @@
+import io
+import os
+import sys
+import time
+import marshal
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from fnmatch import fnmatchcase
+from threading import Lock
+
+MODES = ('cprofile', 'sampling')
+# output formats each mode can produce, the first is the default
+FORMATS = {'cprofile': ('text', 'pstats'), 'sampling': ('collapsed',)}
+# functions listed in the text output
+TEXT_LIMIT = 60
+
+
+def collapse(frame):
+    # a stack root first, as file:function names joined by ';'
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class RequestProfiler:
+    '''
+    profiles the next `count` requests whose path matches a glob pattern.
+    in cprofile mode one matching request at a time runs under cProfile
+    and the stats are merged; requests overlapping it are not profiled.
+    in sampling mode one thread records the stacks of every matching
+    request in flight each `interval` seconds, so the cost stays bounded
+    under any load. while disarmed a request costs one attribute check.
+    '''
+
+    def __init__(self):
+        self.pattern = None
+        self.mode = None
+        self.remaining = 0
+        self.captured = 0
+        self.interval = None
+        self.stats = None
+        self.stacks = Counter()
+        self.active = {}
+        self.sampler = None
+        self.generation = 0
+        self.lock = Lock()
+
+    def arm(self, pattern, count, mode='cprofile', interval=0.005):
+        # drops the previous results
+        with self.lock:
+            self.mode = mode
+            self.remaining = count
+            self.captured = 0
+            self.interval = interval
+            self.stats = None
+            self.stacks = Counter()
+            # requests still running from before are not aggregated
+            self.generation += 1
+            self.pattern = pattern
+            if mode == 'sampling' and self.sampler is None:
+                self.sampler = threading.Thread(
+                    target=self.sample, name='request-profiler', daemon=True)
+                self.sampler.start()
+
+    def disarm(self):
+        with self.lock:
+            self.pattern = None
+            self.remaining = 0
+
+    def status(self):
+        return {
+            'pattern': self.pattern,
+            'mode': self.mode,
+            'remaining': self.remaining,
+            'captured': self.captured
+        }
+
+    def start(self, path):
+        # before_request: begins profiling if the request is wanted
+        if self.pattern is None or not fnmatchcase(path, self.pattern):
+            return
+        profile = None
+        with self.lock:
+            if self.remaining <= 0:
+                return
+            if self.mode == 'cprofile':
+                if self.active:
+                    return
+                profile = cProfile.Profile()
+            self.active[threading.get_ident()] = (self.generation, profile)
+            self.remaining -= 1
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler owns the interpreter
+                with self.lock:
+                    del self.active[threading.get_ident()]
+                    self.remaining += 1
+
+    def stop(self, *args):
+        # teardown_request: ends and aggregates a profiled request
+        if not self.active:
+            return
+        ident = threading.get_ident()
+        if ident not in self.active:
+            return
+        generation, profile = self.active[ident]
+        if profile is not None:
+            profile.disable()
+        with self.lock:
+            del self.active[ident]
+            if generation != self.generation:
+                return
+            self.captured += 1
+            if profile is not None:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+            if self.remaining <= 0 and not self.active:
+                self.pattern = None
+
+    def sample(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                if self.mode != 'sampling' or (
+                        self.pattern is None and not self.active):
+                    self.sampler = None
+                    return
+                for ident in self.active:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self.stacks[collapse(frame)] += 1
+
+    def result(self, output=None):
+        '''
+        the output name and the aggregated results as bytes: 'text' is
+        the cProfile stats by cumulative time, 'pstats' a stats file
+        pstats and snakeviz read, 'collapsed' one "stack count" line per
+        sampled stack, the input of flamegraph.pl. raises ValueError if
+        the mode cannot produce the output.
+        '''
+        formats = FORMATS.get(self.mode, ())
+        output = output or (formats[0] if formats else None)
+        if output not in formats:
+            raise ValueError(f'{output} is not available in {self.mode} mode')
+        with self.lock:
+            if output == 'collapsed':
+                return output, ''.join(
+                    f'{stack} {count}\n' for stack, count in
+                    self.stacks.most_common()).encode('utf-8')
+            if self.stats is None:
+                return output, b''
+            if output == 'pstats':
+                return output, marshal.dumps(self.stats.stats)
+            text = io.StringIO()
+            self.stats.stream = text
+            self.stats.sort_stats('cumulative').print_stats(TEXT_LIMIT)
+            return output, text.getvalue().encode('utf-8')
@@ -0,0 +1,90 @@
+from sqlalchemy import bindparam, func
+from sqlalchemy.ext import baked
+
+from models import db, Question
+from .serialize import QUESTION_COLUMNS, QuestionRow
+
+# the hot queries are baked: built and compiled on first use, then
+# only executed with new bound parameters
+bakery = baked.bakery()
+
+
+def in_category(query):
+    return query.filter(Question.category == bindparam('category'))
+
+
+def page_query(by_category, keyset):
+    query = bakery(lambda session: session.query(
+        *QUESTION_COLUMNS).order_by(Question.id))
+    if by_category:
+        query += in_category
+    if keyset:
+        query += lambda query: query.filter(
+            Question.id > bindparam('after_id')).limit(bindparam('limit'))
+    else:
+        query += lambda query: query.offset(bindparam('offset')).limit(
+            bindparam('limit'))
+    return query
+
+
+PAGE_QUERIES = {(by_category, keyset): page_query(by_category, keyset)
+                for by_category in (False, True) for keyset in (False, True)}
+COUNT_QUERY = bakery(lambda session: session.query(func.count(Question.id)))
+CATEGORY_COUNT_QUERY = COUNT_QUERY.with_criteria(in_category)
+POOL_QUERY = bakery(lambda session: session.query(
+    Question.id, Question.difficulty))
+CATEGORY_POOL_QUERY = POOL_QUERY.with_criteria(in_category)
+QUESTION_QUERY = bakery(lambda session: session.query(
+    *QUESTION_COLUMNS).filter(Question.id == bindparam('id')))
+QUESTIONS_QUERY = bakery(lambda session: session.query(
+    *QUESTION_COLUMNS).filter(Question.id.in_(
+        bindparam('ids', expanding=True))))
+ANSWERS_QUERY = bakery(lambda session: session.query(
+    Question.id, Question.answer).filter(Question.id.in_(
+        bindparam('ids', expanding=True))))
+
+
+def question_page(category, limit, offset=0, after_id=None):
+    '''
+    a page of (id, question, answer, category, difficulty) rows of a
+    category (None for all questions) by id, after `offset` rows or,
+    with after_id, after that id
+    '''
+    query = PAGE_QUERIES[category is not None, after_id is not None]
+    return query(db.session()).params(
+        category=category, after_id=after_id, offset=offset,
+        limit=limit).all()
+
+
+def question_count(category=None):
+    if category is None:
+        return COUNT_QUERY(db.session()).scalar()
+    return CATEGORY_COUNT_QUERY(db.session()).params(
+        category=category).scalar()
+
+
+def pool_rows(category=None):
+    # (id, difficulty) of the questions of a category
+    if category is None:
+        return POOL_QUERY(db.session())
+    return CATEGORY_POOL_QUERY(db.session()).params(category=category)
+
+
+def question_row(question_id):
+    row = QUESTION_QUERY(db.session()).params(id=question_id).one_or_none()
+    return None if row is None else QuestionRow(*row)
+
+
+def question_rows(ids):
+    # QuestionRows by id, for the ids that exist
+    if not ids:
+        return {}
+    return {row[0]: QuestionRow(*row) for row in
+            QUESTIONS_QUERY(db.session()).params(ids=list(ids))}
+
+
+def question_answers(ids):
+    # the answer text by id, for the ids that exist
+    if not ids:
+        return {}
+    return dict(ANSWERS_QUERY(db.session()).params(ids=list(ids)))
@@ -0,0 +1,256 @@
+import json
+import time
+import uuid
+import random
+from array import array
+from threading import Lock
+
+from .queries import pool_rows, question_row
+
+# random draws tried before falling back to a scan of the unseen ids
+REJECTION_TRIES = 16
+FEISTEL_ROUNDS = 4
+DIFFICULTIES = range(1, 6)
+DEFAULT_DIFFICULTY = 3
+# adaptive quizzes look at this many recent answers
+ADAPTIVE_WINDOW = 5
+ADAPTIVE_STEP_UP = 0.8
+ADAPTIVE_STEP_DOWN = 0.4
+EMPTY_POOL = array('i')
+
+
+def quiz_category_id(quiz_category):
+    '''
+    the category id as stored in Question.category, or None for all
+    categories. accepts an id or the {'type', 'id'} object the frontend
+    posts, where id 0 means "ALL". raises ValueError for anything else.
+    '''
+    if isinstance(quiz_category, dict):
+        quiz_category = quiz_category.get('id')
+    if quiz_category in (None, '', 0, '0'):
+        return None
+    try:
+        return int(quiz_category)
+    except TypeError:
+        raise ValueError(f'invalid quiz category {quiz_category!r}')
+
+
+class QuestionPool:
+    '''
+    question ids per category (None for all questions) in compact
+    array('i')s, with the same ids bucketed by difficulty. a category is
+    loaded from the database in one query on first use and then kept
+    current by the question listeners; it is reloaded after `ttl`
+    seconds to pick up writes made by other workers.
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.pools = {}
+        self.lock = Lock()
+
+    def load(self, category):
+        now = time.monotonic()
+        pool = self.pools.get(category)
+        if pool is not None and pool[2] > now:
+            return pool
+        ids = array('i')
+        buckets = {}
+        for question_id, difficulty in pool_rows(category):
+            ids.append(question_id)
+            buckets.setdefault(difficulty, array('i')).append(question_id)
+        pool = (ids, buckets, now + self.ttl)
+        with self.lock:
+            self.pools[category] = pool
+        return pool
+
+    def ids(self, category, difficulty=None):
+        ids, buckets, _ = self.load(category)
+        if difficulty is None:
+            return ids
+        return buckets.get(difficulty, EMPTY_POOL)
+
+    def pick(self, category, previous_questions, difficulty=None):
+        ids = self.ids(category, difficulty)
+        if not ids:
+            return None
+        seen = set(previous_questions)
+        # rejection sampling stays O(1) while most of the pool is unseen
+        for _ in range(REJECTION_TRIES):
+            question_id = ids[random.randrange(len(ids))]
+            if question_id not in seen:
+                return question_id
+        unseen = [question_id for question_id in ids
+                  if question_id not in seen]
+        return random.choice(unseen) if unseen else None
+
+    def draw(self, category, previous_questions, difficulty=None):
+        # fetches just the picked row by primary key
+        while True:
+            question_id = self.pick(category, previous_questions, difficulty)
+            if question_id is None:
+                return None
+            question = self.fetch(question_id)
+            if question is not None:
+                return question
+            self.discard(question_id)
+
+    def fetch(self, question_id):
+        # the columns of format() only, no ORM instance
+        return question_row(question_id)
+
+    def discard(self, question_id):
+        with self.lock:
+            for ids, buckets, _ in self.pools.values():
+                for pool in (ids, *buckets.values()):
+                    if question_id in pool:
+                        pool.remove(question_id)
+
+    def on_question_change(self, action, question):
+        if action == 'insert':
+            question_id = question.id
+            difficulty = question.difficulty
+            with self.lock:
+                for category in {None, question.category}:
+                    if category in self.pools:
+                        ids, buckets, _ = self.pools[category]
+                        ids.append(question_id)
+                        buckets.setdefault(
+                            difficulty, array('i')).append(question_id)
+        elif action == 'delete':
+            self.discard(question.id)
+        else:
+            # the previous category of an updated question is unknown
+            with self.lock:
+                self.pools.clear()
+
+
+def target_difficulty(recent_answers, difficulty=None):
+    '''
+    the difficulty to serve next: one step up when at least
+    ADAPTIVE_STEP_UP of the last ADAPTIVE_WINDOW answers (booleans, most
+    recent last) were correct, one step down at ADAPTIVE_STEP_DOWN or
+    less, else `difficulty` (the last one served) again
+    '''
+    if difficulty not in DIFFICULTIES:
+        return DEFAULT_DIFFICULTY
+    recent = [bool(correct) for correct in recent_answers[-ADAPTIVE_WINDOW:]]
+    if not recent:
+        return difficulty
+    accuracy = sum(recent) / len(recent)
+    if accuracy >= ADAPTIVE_STEP_UP:
+        return min(difficulty + 1, DIFFICULTIES[-1])
+    if accuracy <= ADAPTIVE_STEP_DOWN:
+        return max(difficulty - 1, DIFFICULTIES[0])
+    return difficulty
+
+
+def nearest_difficulties(target):
+    # the target first, then the others by distance, easier ones first
+    return sorted(DIFFICULTIES, key=lambda difficulty: (
+        abs(difficulty - target), difficulty))
+
+
+def permute(index, size, seed):
+    '''
+    position `index` of a seeded permutation of range(size), computed
+    without building the permutation: a small Feistel network over the
+    next even bit width, cycle-walking values that fall outside size.
+    '''
+    bits = max(2, (size - 1).bit_length())
+    bits += bits & 1
+    half = bits // 2
+    mask = (1 << half) - 1
+    keys = [(seed * 0x9E3779B1 + round * 0x85EBCA6B) & 0xffffffff
+            for round in range(FEISTEL_ROUNDS)]
+    value = index
+    while True:
+        left, right = value >> half, value & mask
+        for key in keys:
+            mixed = ((right ^ key) * 0x45D9F3B) & 0xffffffff
+            left, right = right, left ^ ((mixed ^ (mixed >> 16)) & mask)
+        value = (left << half) | right
+        if value < size:
+            return value
+
+
+class QuizSessions:
+    '''
+    server-side quiz sessions. a session is stored as its deck id, seed
+    and cursor; the deck is a snapshot of the category's question ids,
+    shared by every session a worker starts for that category within
+    `deck_reuse` seconds. `store` is a MemoryStore or any client with the
+    redis get/set/expire/delete api.
+    '''
+
+    def __init__(self, store, pool, ttl, deck_reuse):
+        self.store = store
+        self.pool = pool
+        self.ttl = ttl
+        self.deck_reuse = deck_reuse
+        self.decks = {}
+        self.lock = Lock()
+
+    def deck_for(self, category):
+        now = time.monotonic()
+        with self.lock:
+            deck = self.decks.get(category)
+            if deck is not None and deck[2] > now:
+                return deck
+        ids = self.pool.ids(category)
+        deck = (uuid.uuid4().hex, len(ids), now + self.deck_reuse)
+        # outlives every session that may be started on it
+        self.store.set(f'quiz:deck:{deck[0]}', ids.tobytes(),
+                       ex=self.deck_reuse + self.ttl)
+        with self.lock:
+            self.decks[category] = deck
+        return deck
+
+    def start(self, category):
+        # (None, 0) without storing a session when the category is empty
+        deck_id, size, _ = self.deck_for(category)
+        if size == 0:
+            return None, 0
+        session_id = uuid.uuid4().hex
+        self.save(session_id, {
+            'deck': deck_id,
+            'size': size,
+            'seed': random.getrandbits(32),
+            'cursor': 0
+        })
+        return session_id, size
+
+    def save(self, session_id, session):
+        self.store.set(f'quiz:session:{session_id}', json.dumps(session),
+                       ex=self.ttl)
+        # the deck lives on as long as a session that is still played
+        self.store.expire(f'quiz:deck:{session["deck"]}',
+                          self.deck_reuse + self.ttl)
+
+    def next_question(self, session_id):
+        '''
+        advances the session and returns (found, question); question is
+        None once the deck is exhausted
+        '''
+        session = self.store.get(f'quiz:session:{session_id}')
+        if session is None:
+            return False, None
+        session = json.loads(session)
+        deck = None
+        question = None
+        while question is None and session['cursor'] < session['size']:
+            if deck is None:
+                deck = self.store.get(f'quiz:deck:{session["deck"]}')
+                if deck is None:
+                    return False, None
+                deck = array('i', deck)
+            position = permute(session['cursor'], session['size'],
+                               session['seed'])
+            session['cursor'] += 1
+            # questions deleted since the deck was taken are skipped
+            question = self.pool.fetch(deck[position])
+        self.save(session_id, session)
+        return True, question
+
+    def end(self, session_id):
+        return bool(self.store.delete(f'quiz:session:{session_id}'))
@@ -0,0 +1,169 @@
+import time
+import heapq
+from threading import Lock
+from flask import current_app
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, QuizScore
+
+
+def rank(entry):
+    # most correct answers first, then fewest answered, then by name
+    player, (correct, answered) = entry
+    return -correct, answered, player
+
+
+class ScoreBoard:
+    '''
+    quiz scores aggregated in memory per worker. answers are added to
+    per-category totals at once and to pending deltas that are written
+    in one batched upsert when `flush_size` players are pending or
+    `flush_interval` seconds have passed (see flush_if_due, which runs
+    on a timer as well), and on shutdown. a category's
+    totals are loaded on first use and reloaded after `ttl` seconds to
+    pick up the scores flushed by other workers; the top `board_size`
+    players of a category are kept sorted and updated in place as
+    players climb.
+    '''
+
+    def __init__(self, flush_size, flush_interval, ttl, board_size):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.board_size = board_size
+        self.pending = {}
+        self.totals = {}
+        self.boards = {}
+        self.flush_due = time.monotonic() + flush_interval
+        self.lock = Lock()
+
+    def load(self, category):
+        now = time.monotonic()
+        totals = self.totals.get(category)
+        if totals is not None and totals[1] > now:
+            return totals[0]
+        scores = {player: [correct, answered] for player, correct, answered in
+                  db.session.query(QuizScore.player, QuizScore.correct,
+                                   QuizScore.answered).filter(
+                      QuizScore.category == category)}
+        with self.lock:
+            # answers not flushed yet are not in the database
+            for (player, pending_category), delta in self.pending.items():
+                if pending_category == category:
+                    score = scores.setdefault(player, [0, 0])
+                    score[0] += delta[0]
+                    score[1] += delta[1]
+            self.totals[category] = (scores, now + self.ttl)
+            self.boards.pop(category, None)
+        return scores
+
+    def record(self, player, category, correct):
+        '''
+        adds one answer and returns the player's (correct, answered)
+        in the category
+        '''
+        scores = self.load(category)
+        with self.lock:
+            delta = self.pending.setdefault((player, category), [0, 0])
+            delta[0] += correct
+            delta[1] += 1
+            score = scores.setdefault(player, [0, 0])
+            score[0] += correct
+            score[1] += 1
+            self.update_board(category, player, score, correct)
+            due = (len(self.pending) >= self.flush_size
+                   or time.monotonic() >= self.flush_due)
+        if due:
+            try:
+                self.flush()
+            except SQLAlchemyError:
+                # the deltas stay pending for the next flush
+                current_app.logger.exception('flushing quiz scores failed')
+        return tuple(score)
+
+    def flush_if_due(self):
+        # flushes once `flush_interval` has passed, even if no answer came
+        with self.lock:
+            due = bool(self.pending) and time.monotonic() >= self.flush_due
+        if due:
+            self.flush()
+        return due
+
+    def update_board(self, category, player, score, correct):
+        board = self.boards.get(category)
+        if board is None:
+            return
+        full = len(board) == self.board_size
+        on_board = player in dict(board)
+        if full and on_board and not correct:
+            # a wrong answer moves the player down, maybe below someone
+            # outside the top, so the top is rebuilt on the next read
+            del self.boards[category]
+            return
+        # otherwise a player only climbs
+        if full and not on_board and rank((player, score)) > rank(board[-1]):
+            return
+        board = [entry for entry in board if entry[0] != player]
+        board.append((player, tuple(score)))
+        board.sort(key=rank)
+        self.boards[category] = board[:self.board_size]
+
+    def leaderboard(self, category, limit):
+        scores = self.load(category)
+        with self.lock:
+            board = self.boards.get(category)
+            if board is None:
+                board = heapq.nsmallest(
+                    self.board_size, ((player, tuple(score))
+                                      for player, score in scores.items()),
+                    key=rank)
+                self.boards[category] = board
+        return board[:limit]
+
+    def flush(self):
+        '''
+        writes the pending deltas in one upsert; on failure they are
+        kept for the next flush and the error is raised
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flush_due = time.monotonic() + self.flush_interval
+        if not pending:
+            return 0
+        rows = [{'player': player, 'category': category,
+                 'correct': correct, 'answered': answered}
+                for (player, category), (correct, answered) in pending.items()]
+        try:
+            self.upsert(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self.lock:
+                for key, (correct, answered) in pending.items():
+                    delta = self.pending.setdefault(key, [0, 0])
+                    delta[0] += correct
+                    delta[1] += answered
+            raise
+        return len(rows)
+
+    def upsert(self, rows):
+        table = QuizScore.__table__
+        if db.engine.dialect.name == 'postgresql':
+            statement = postgresql.insert(table)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.player, table.c.category],
+                set_={
+                    'correct': table.c.correct + statement.excluded.correct,
+                    'answered': table.c.answered + statement.excluded.answered
+                }), rows)
+            return
+        # other databases have no upsert here: update, then insert the misses
+        for row in rows:
+            updated = db.session.execute(table.update().where(
+                (table.c.player == row['player'])
+                & (table.c.category == row['category'])).values(
+                correct=table.c.correct + row['correct'],
+                answered=table.c.answered + row['answered']))
+            if updated.rowcount == 0:
+                db.session.execute(table.insert(), row)
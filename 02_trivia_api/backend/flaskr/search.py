@@ -0,0 +1,236 @@
+import os
+import re
+import math
+import heapq
+import pickle
+from threading import Lock
+from markupsafe import escape, Markup
+from sqlalchemy import bindparam, func, literal_column
+
+from models import db, Question, SEARCH_DOCUMENT
+from .queries import bakery, question_rows
+from .serialize import QUESTION_COLUMNS, QuestionRow
+
+# ts_headline does not escape the text, so it marks the matches with
+# control characters that are swapped for <mark> after escaping
+START_SENTINEL = '\x02'
+STOP_SENTINEL = '\x03'
+HIGHLIGHT_OPTIONS = (f'StartSel={START_SENTINEL}, StopSel={STOP_SENTINEL}, '
+                     'HighlightAll=true')
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'does',
+    'for', 'from', 'has', 'have', 'in', 'is', 'it', 'its', 'of', 'on', 'or',
+    'that', 'the', 'this', 'to', 'was', 'were', 'what', 'when', 'where',
+    'which', 'who', 'whose', 'why', 'with'))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return [token for token in re.findall(r'\w+', (text or '').casefold())
+            if token not in STOPWORDS]
+
+
+def highlight(text, tokens):
+    # escapes the text and wraps the searched words in <mark>
+    tokens = set(tokens)
+    parts = re.split(r'(\w+)', text or '')
+    return Markup('').join(
+        Markup('<mark>%s</mark>') % part if part.casefold() in tokens
+        else escape(part) for part in parts)
+
+
+def headline_markup(headline):
+    # the escaped ts_headline output with its sentinels as <mark> tags
+    return Markup(str(escape(headline)).replace(
+        START_SENTINEL, '<mark>').replace(STOP_SENTINEL, '</mark>'))
+
+
+def search_terms():
+    # the tsvector expression and the tsquery of the bound search term
+    return (literal_column(SEARCH_DOCUMENT),
+            func.plainto_tsquery('english', bindparam('term')))
+
+
+def matches(query):
+    document, terms = search_terms()
+    return query.filter(document.op('@@')(terms))
+
+
+def ranked(query):
+    document, terms = search_terms()
+    return query.order_by(func.ts_rank_cd(document, terms).desc(),
+                          Question.id).offset(bindparam('offset')).limit(
+        bindparam('limit'))
+
+
+def headline(column):
+    return func.ts_headline('english', column, search_terms()[1],
+                            HIGHLIGHT_OPTIONS)
+
+
+SEARCH_QUERY = bakery(lambda session: session.query(
+    *QUESTION_COLUMNS, headline(Question.question),
+    headline(Question.answer)))
+SEARCH_QUERY += matches
+SEARCH_QUERY += ranked
+SEARCH_COUNT_QUERY = bakery(lambda session: session.query(
+    func.count(Question.id)))
+SEARCH_COUNT_QUERY += matches
+
+
+class PostgresSearch:
+    '''
+    ranked search over question and answer text with the GIN indexed
+    tsvector expression, ts_rank_cd for relevance and ts_headline for
+    the question and answer highlights
+    '''
+
+    def search(self, term, offset, limit):
+        rows = SEARCH_QUERY(db.session()).params(
+            term=term, offset=offset, limit=limit).all()
+        total = SEARCH_COUNT_QUERY(db.session()).params(term=term).scalar()
+        return [(QuestionRow(*row[:-2]), headline_markup(row[-2]),
+                 headline_markup(row[-1])) for row in rows], total
+
+
+class InvertedIndex:
+    '''
+    in-memory inverted index over question and answer text with BM25
+    ranking, for SQLite or offline use. it is kept current by the question
+    listeners and snapshotted to `path`, which is reused on start up as
+    long as the question count and highest id still match the database.
+    an update keeps both, so it discards the snapshot until the next one.
+    '''
+
+    def __init__(self, path=None, snapshot_every=100):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.postings = {}
+        self.documents = {}
+        self.total_length = 0
+        self.changes = 0
+        self.loaded = False
+        self.lock = Lock()
+
+    def database_state(self):
+        return tuple(db.session.query(
+            func.count(Question.id), func.max(Question.id)).one())
+
+    def load(self):
+        state = self.database_state()
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'rb') as snapshot:
+                data = pickle.load(snapshot)
+            if data['state'] == state:
+                self.postings = data['postings']
+                self.documents = data['documents']
+                self.total_length = data['total_length']
+                self.loaded = True
+                return
+        for question_id, question, answer in db.session.query(
+                Question.id, Question.question,
+                Question.answer).yield_per(10000):
+            self.add(question_id, question, answer)
+        self.loaded = True
+        self.save(state)
+
+    def save(self, state=None):
+        if not self.path:
+            return
+        data = {
+            'state': state or self.database_state(),
+            'postings': self.postings,
+            'documents': self.documents,
+            'total_length': self.total_length
+        }
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'wb') as snapshot:
+            pickle.dump(data, snapshot, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
+
+    def add(self, question_id, question, answer):
+        tokens = tokenize(question) + tokenize(answer)
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            self.postings.setdefault(token, {})[question_id] = frequency
+        self.documents[question_id] = (len(tokens), tuple(frequencies))
+        self.total_length += len(tokens)
+
+    def remove(self, question_id):
+        length, tokens = self.documents.pop(question_id, (0, ()))
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is not None:
+                posting.pop(question_id, None)
+                if not posting:
+                    del self.postings[token]
+        self.total_length -= length
+
+    def discard_snapshot(self):
+        # an updated question leaves the count and highest id as they
+        # were, so a snapshot from before could not be told apart
+        if not self.path:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def on_question_change(self, action, question):
+        if action == 'update':
+            self.discard_snapshot()
+        if not self.loaded:
+            return
+        question_id = question.id
+        with self.lock:
+            self.remove(question_id)
+            if action != 'delete':
+                self.add(question_id, question.question, question.answer)
+            self.changes += 1
+            if self.changes % self.snapshot_every == 0:
+                self.save()
+
+    def rank(self, tokens):
+        # every token has to match; the shortest posting list drives
+        postings = sorted((self.postings.get(token, {})
+                           for token in set(tokens)), key=len)
+        if not postings or not postings[0]:
+            return {}
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return {}
+        count = len(self.documents)
+        average = self.total_length / count if count else 0
+        scores = dict.fromkeys(candidates, 0.0)
+        for posting in postings:
+            idf = math.log(
+                1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for question_id in candidates:
+                frequency = posting[question_id]
+                length = self.documents[question_id][0]
+                scores[question_id] += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (
+                        1 - BM25_B + BM25_B * length / average))
+        return scores
+
+    def search(self, term, offset, limit):
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            tokens = tokenize(term)
+            scores = self.rank(tokens)
+            top = heapq.nsmallest(
+                offset + limit, scores,
+                key=lambda question_id: (-scores[question_id], question_id)
+            )[offset:]
+        questions = question_rows(top)
+        return [(questions[question_id],
+                 highlight(questions[question_id].question, tokens),
+                 highlight(questions[question_id].answer, tokens))
+                for question_id in top
+                if question_id in questions], len(scores)
@@ -0,0 +1,108 @@
+import json
+from collections import namedtuple
+from json.encoder import encode_basestring_ascii
+from flask import Response
+
+from models import Question
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the columns of Question.format(), selected as plain tuples
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+QUESTION_TEMPLATE = ('{"id":%s,"question":%s,"answer":%s,'
+                     '"category":%s,"difficulty":%s}')
+# rows encoded per chunk of a streamed export
+STREAM_CHUNK_ROWS = 1000
+
+
+class QuestionRow(namedtuple('QuestionRow', (
+        'id', 'question', 'answer', 'category', 'difficulty'))):
+    '''
+    a question selected as the QUESTION_COLUMNS tuple, without an ORM
+    instance, with the Question.format() shape
+    '''
+    __slots__ = ()
+
+    def format(self):
+        return self._asdict()
+
+
+def dumps(payload):
+    '''
+    dumps(payload)
+    compact JSON bytes, with orjson when it is installed
+    '''
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def encode_text(value):
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def encode_number(value):
+    return 'null' if value is None else '%d' % value
+
+
+def encode_question(row):
+    # one (id, question, answer, category, difficulty) tuple as a JSON object
+    question_id, question, answer, category, difficulty = row
+    return QUESTION_TEMPLATE % (
+        question_id, encode_text(question), encode_text(answer),
+        encode_number(category), encode_number(difficulty))
+
+
+def encode_questions(rows):
+    return ('[' + ','.join(map(encode_question, rows)) + ']').encode('ascii')
+
+
+def questions_body(rows, **fields):
+    '''
+    the JSON object of `fields` with the question rows under "questions",
+    encoded straight from the tuples without a dict per question
+    '''
+    body = dumps(fields)
+    return (b'{"questions":' + encode_questions(rows)
+            + (b',' + body[1:] if len(body) > 2 else b'}'))
+
+
+def questions_response(rows, **fields):
+    return Response(questions_body(rows, **fields),
+                    mimetype='application/json')
+
+
+def stream_questions(rows, lines=False):
+    '''
+    the question rows as a JSON array, or JSON Lines with lines=True,
+    yielded in chunks of STREAM_CHUNK_ROWS so an export of any size is
+    never held in memory
+    '''
+    separator = '\n' if lines else ','
+    chunk = []
+    first = True
+    if not lines:
+        yield b'['
+    for row in rows:
+        chunk.append(encode_question(row))
+        if len(chunk) == STREAM_CHUNK_ROWS:
+            yield encode_chunk(chunk, separator, first, lines)
+            chunk = []
+            first = False
+    if chunk:
+        yield encode_chunk(chunk, separator, first, lines)
+    if not lines:
+        yield b']'
+
+
+def encode_chunk(chunk, separator, first, lines):
+    text = separator.join(chunk)
+    if lines:
+        text += '\n'
+    elif not first:
+        text = ',' + text
+    return text.encode('ascii')
@@ -0,0 +1,207 @@
+import os
+import mmap
+import time
+import struct
+from array import array
+from bisect import bisect_right
+from threading import Lock
+
+from models import db, Question, Category
+from .cache import encode_payload
+from .quiz import QuestionPool
+from .serialize import QuestionRow
+
+# snapshot file layout, little endian:
+#   header       magic, category count, question count
+#   categories   (id, type offset, type length, first, count) per category;
+#                first and count select its ids in `by category`
+#   questions    (id, category, difficulty, question offset, question
+#                length, answer offset, answer length) per question, by id
+#   ids          int32 question ids, by id
+#   by category  int32 question ids grouped by category, by id within one
+#   blob         utf-8 text the offsets point into
+# a NULL category or difficulty is stored as -1.
+MAGIC = b'TRIVIA01'
+HEADER = struct.Struct('<8sII')
+CATEGORY = struct.Struct('<iIIII')
+QUESTION = struct.Struct('<iiiIIII')
+NULL = -1
+
+
+def write_snapshot(path):
+    '''
+    exports the categories and questions to `path`; the file is written
+    beside it and renamed over it, so readers see the old or the new one
+    '''
+    blob = bytearray()
+
+    def text(value):
+        data = (value or '').encode('utf-8')
+        offset = len(blob)
+        blob.extend(data)
+        return offset, len(data)
+
+    questions = db.session.query(
+        Question.id, Question.question, Question.answer, Question.category,
+        Question.difficulty).order_by(Question.id).all()
+    grouped = {}
+    for question in questions:
+        if question.category is not None:
+            grouped.setdefault(question.category, []).append(question.id)
+    categories = db.session.query(Category.id, Category.type).order_by(
+        Category.id).all()
+
+    by_category = array('i')
+    category_table = bytearray()
+    for category_id, category_type in categories:
+        ids = grouped.get(category_id, [])
+        category_table += CATEGORY.pack(
+            category_id, *text(category_type), len(by_category), len(ids))
+        by_category.extend(ids)
+    question_table = bytearray()
+    for question in questions:
+        question_table += QUESTION.pack(
+            question.id,
+            NULL if question.category is None else question.category,
+            NULL if question.difficulty is None else question.difficulty,
+            *text(question.question), *text(question.answer))
+    ids = array('i', (question.id for question in questions))
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, len(categories), len(questions)))
+        snapshot.write(category_table)
+        snapshot.write(question_table)
+        snapshot.write(ids.tobytes())
+        snapshot.write(by_category.tobytes())
+        snapshot.write(blob)
+    os.replace(temporary, path)
+    return len(categories), len(questions)
+
+
+class Snapshot:
+    '''
+    a snapshot file mapped read only. the mapping is shared by every
+    process that opens the file, and rows are decoded only when read.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot:
+            self.map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        magic, category_count, question_count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a trivia snapshot')
+        offset = HEADER.size
+        self.categories = {}
+        for _ in range(category_count):
+            category_id, *fields = CATEGORY.unpack_from(view, offset)
+            self.categories[category_id] = fields
+            offset += CATEGORY.size
+        self.questions = view[offset:offset + question_count * QUESTION.size]
+        offset += len(self.questions)
+        self.ids = view[offset:offset + question_count * 4].cast('i')
+        offset += question_count * 4
+        # questions without a category are in no group
+        grouped = sum(fields[3] for fields in self.categories.values())
+        self.by_category = view[offset:offset + grouped * 4].cast('i')
+        offset += grouped * 4
+        self.blob = view[offset:]
+        self.categories_payload = encode_payload({
+            'success': True,
+            'categories': [{'id': category_id, 'type': self.text(*fields[:2])}
+                           for category_id, fields in self.categories.items()]
+        })
+
+    def text(self, offset, length):
+        return str(self.blob[offset:offset + length], 'utf-8')
+
+    def question(self, row):
+        (question_id, category, difficulty, question_offset, question_length,
+         answer_offset, answer_length) = QUESTION.unpack_from(
+            self.questions, row * QUESTION.size)
+        return QuestionRow(
+            question_id, self.text(question_offset, question_length),
+            self.text(answer_offset, answer_length),
+            None if category == NULL else category,
+            None if difficulty == NULL else difficulty)
+
+    def row_of(self, question_id):
+        row = bisect_right(self.ids, question_id) - 1
+        return row if row >= 0 and self.ids[row] == question_id else None
+
+    def get(self, question_id):
+        row = self.row_of(question_id)
+        return None if row is None else self.question(row)
+
+    def category_ids(self, category):
+        # the ids of a category (None for all questions), by id
+        if category is None:
+            return self.ids
+        fields = self.categories.get(category)
+        if fields is None:
+            return self.by_category[0:0]
+        first, count = fields[2:]
+        return self.by_category[first:first + count]
+
+
+class QuestionSnapshot:
+    '''
+    the current Snapshot of `path`. the file is checked at most every
+    `check_interval` seconds and a replaced file is mapped again; requests
+    already holding the previous snapshot finish on it.
+    '''
+
+    def __init__(self, path, check_interval):
+        self.path = path
+        self.check_interval = check_interval
+        self.snapshot = None
+        self.identity = None
+        self.checked = 0
+        self.lock = Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if (self.snapshot is not None
+                and now < self.checked + self.check_interval):
+            return self.snapshot
+        with self.lock:
+            stat = os.stat(self.path)
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if identity != self.identity:
+                self.snapshot = Snapshot(self.path)
+                self.identity = identity
+            self.checked = now
+        return self.snapshot
+
+
+class SnapshotPool(QuestionPool):
+    '''
+    quiz picks over the id arrays of the current snapshot; difficulty
+    buckets are built per category the first time they are asked for
+    '''
+
+    def __init__(self, snapshots):
+        super().__init__(ttl=None)
+        self.snapshots = snapshots
+        self.buckets = (None, {})
+
+    def ids(self, category, difficulty=None):
+        snapshot = self.snapshots.current()
+        ids = snapshot.category_ids(category)
+        if difficulty is None:
+            return ids
+        built_for, buckets = self.buckets
+        if built_for is not snapshot:
+            buckets = {}
+            self.buckets = (snapshot, buckets)
+        if category not in buckets:
+            bucket = {}
+            for question_id in ids:
+                bucket.setdefault(snapshot.get(question_id).difficulty,
+                                  array('i')).append(question_id)
+            buckets[category] = bucket
+        return buckets[category].get(difficulty, array('i'))
+
+    def fetch(self, question_id):
+        return self.snapshots.current().get(question_id)
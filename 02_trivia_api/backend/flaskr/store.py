@@ -0,0 +1,75 @@
+import time
+from threading import Lock
+
+# expired keys are swept once every this many writes
+SWEEP_EVERY = 1000
+
+
+class MemoryStore:
+    '''
+    in-process key/value store with per-key expiry. it speaks the small
+    part of the redis client api used here (get, set with ex, incr,
+    expire and delete), so it doubles as the local stand-in for a shared store.
+    '''
+
+    def __init__(self):
+        self.data = {}
+        self.writes = 0
+        self.lock = Lock()
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        expires = None if ex is None else time.monotonic() + ex
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.writes += 1
+            if self.writes % SWEEP_EVERY == 0:
+                self.sweep()
+        return True
+
+    def incr(self, key):
+        with self.lock:
+            value, expires = self.data.get(key, (0, None))
+            value = int(value) + 1
+            self.data[key] = (value, expires)
+            return value
+
+    def expire(self, key, seconds):
+        # 1 when the key exists and gets the new expiry, like redis
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or (item[1] is not None
+                                and item[1] <= time.monotonic()):
+                return 0
+            self.data[key] = (item[0], time.monotonic() + seconds)
+            return 1
+
+    def delete(self, key):
+        with self.lock:
+            return int(self.data.pop(key, None) is not None)
+
+    def sweep(self):
+        now = time.monotonic()
+        for key in [key for key, (_, expires) in self.data.items()
+                    if expires is not None and expires <= now]:
+            del self.data[key]
+
+
+def store_from_url(url):
+    '''
+    store_from_url(url)
+    a MemoryStore for None or 'memory://', a redis client otherwise
+    '''
+    if url is None or url.startswith('memory://'):
+        return MemoryStore()
+    import redis
+    return redis.Redis.from_url(url)
@@ -0,0 +1,26 @@
+-- questions.category: varchar compared as text -> indexed integer foreign
+-- key to categories.id. databases restored from trivia.psql already have
+-- the integer column and the constraint, so every step is idempotent.
+-- psql trivia < migrations/0001_question_category_fk.sql
+
+BEGIN;
+
+ALTER TABLE public.questions
+    ALTER COLUMN category TYPE integer USING category::integer;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'public.questions'::regclass AND contype = 'f'
+    ) THEN
+        ALTER TABLE public.questions
+            ADD CONSTRAINT category FOREIGN KEY (category)
+            REFERENCES public.categories(id) ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category
+    ON public.questions USING btree (category);
+
+COMMIT;
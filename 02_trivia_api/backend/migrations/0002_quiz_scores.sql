@@ -0,0 +1,11 @@
+-- per player and category quiz scores, written in batched upserts.
+-- category 0 holds quizzes over all categories.
+-- psql trivia < migrations/0002_quiz_scores.sql
+
+CREATE TABLE IF NOT EXISTS public.quiz_scores (
+    player character varying(80) NOT NULL,
+    category integer NOT NULL,
+    correct integer NOT NULL,
+    answered integer NOT NULL,
+    CONSTRAINT quiz_scores_pkey PRIMARY KEY (player, category)
+);
@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import (Column, String, Integer, ForeignKey, create_engine,
+                        event, DDL)
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -9,17 +10,55 @@ database_path = "postgres://postgres:ayyad@{}/{}".format(
 
 db = SQLAlchemy()
 
+# full text search document, GIN indexed as ix_questions_search on postgres
+SEARCH_DOCUMENT = ("to_tsvector('english', coalesce(question, '') || ' ' "
+                   "|| coalesce(answer, ''))")
+
+question_listeners = []
+category_listeners = []
+
+
+def on_question_change(listener):
+    '''
+    on_question_change(listener)
+    registers listener(action, question), called after a question
+    is committed with action 'insert', 'update' or 'delete'
+    '''
+    question_listeners.append(listener)
+    return listener
+
+
+def on_category_change(listener):
+    '''
+    on_category_change(listener)
+    registers listener(action, category), called after a category
+    is committed with action 'insert', 'update' or 'delete'
+    '''
+    category_listeners.append(listener)
+    return listener
+
+
+def notify_question_listeners(action, question):
+    for listener in question_listeners:
+        listener(action, question)
+
+
+def notify_category_listeners(action, category):
+    for listener in category_listeners:
+        listener(action, category)
+
 
 def setup_db(app, database_path=database_path):
     '''
     setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. nothing is sent
+    to the database here: the engine connects on first use and the
+    schema comes from trivia.psql or `flask trivia init-db`.
     '''
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
 
 
 class Question(db.Model):
@@ -29,7 +68,8 @@ class Question(db.Model):
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', onupdate='CASCADE', ondelete='SET NULL'), index=True)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -41,13 +81,41 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_question_listeners('insert', self)
 
     def update(self):
         db.session.commit()
+        notify_question_listeners('update', self)
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        notify_question_listeners('delete', self)
+
+    @classmethod
+    def insert_many(cls, questions):
+        '''
+        inserts new questions in one transaction. bulk_save_objects skips
+        the unit of work and leaves them out of the session, so their ids
+        (filled in by return_defaults) and fields stay readable after the
+        commit without a refresh.
+        '''
+        db.session.bulk_save_objects(questions, return_defaults=True)
+        db.session.commit()
+        for question in questions:
+            notify_question_listeners('insert', question)
+
+    @classmethod
+    def update_many(cls, questions):
+        '''
+        the batch form of update(): commits the changes made to the
+        questions in one transaction, then reloads them in one query
+        before notifying
+        '''
+        ids = [question.id for question in questions]
+        db.session.commit()
+        for question in cls.query.filter(cls.id.in_(ids)):
+            notify_question_listeners('update', question)
 
     def format(self):
         return {
@@ -59,6 +127,11 @@ class Question(db.Model):
         }
 
 
+event.listen(Question.__table__, 'after_create', DDL(
+    'CREATE INDEX ix_questions_search ON questions USING gin (%s)'
+    % SEARCH_DOCUMENT.replace('%', '%%')).execute_if(dialect='postgresql'))
+
+
 class Category(db.Model):
     ''' Category '''
     __tablename__ = 'categories'
@@ -72,9 +145,41 @@ class Category(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        notify_category_listeners('insert', self)
+
+    def update(self):
+        db.session.commit()
+        notify_category_listeners('update', self)
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+        notify_category_listeners('delete', self)
 
     def format(self):
         return {
             'id': self.id,
             'type': self.type
         }
+
+
+class QuizScore(db.Model):
+    '''
+    QuizScore
+    answers a player got right out of those answered in a category,
+    0 standing for quizzes over all categories
+    '''
+    __tablename__ = 'quiz_scores'
+
+    player = Column(String(80), primary_key=True)
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    correct = Column(Integer, nullable=False, default=0)
+    answered = Column(Integer, nullable=False, default=0)
+
+    def format(self):
+        return {
+            'player': self.player,
+            'category': self.category,
+            'correct': self.correct,
+            'answered': self.answered
+        }
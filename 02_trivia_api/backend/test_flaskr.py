@@ -1,10 +1,19 @@
 import os
+import time
+import gzip
+import tempfile
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.duplicates import DuplicateIndex
+from flaskr.quiz import QuestionPool, QuizSessions
+from flaskr.scores import ScoreBoard
+from flaskr.store import MemoryStore
+from flaskr.cache import GENERATION_KEY
+from models import (setup_db, Question, Category, QuizScore,
+                    question_listeners, category_listeners)
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -43,6 +52,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['categories'])
 
+    def test_retrieve_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = self.client().get('/categories',
+                                headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
     def test_retrieve_paginated_questions(self):
         question = Question('question', 'answer', 1, 3)
         question.insert()
@@ -64,9 +83,34 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'resource not found')
         self.assertFalse(data['success'])
 
+    def test_retrieve_questions_after_id(self):
+        question = Question('question', 'answer', 1, 3)
+        question.insert()
+
+        res = self.client().get(f'/questions?after_id={question.id - 1}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['questions'][0]['id'], question.id)
+        self.assertTrue(data['totalQuestions'])
+
+    def test_404_retrieve_questions_after_last_id(self):
+        question = Question('question', 'answer', 1, 3)
+        question.insert()
+
+        res = self.client().get(f'/questions?after_id={question.id}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'resource not found')
+        self.assertFalse(data['success'])
+
     def test_delete_question(self):
         question = Question('question', 'answer', 1, 3)
         question.insert()
+        total = json.loads(self.client().get('/questions').data)[
+            'totalQuestions']
 
         res = self.client().delete(f'/questions/{question.id}')
         data = json.loads(res.data)
@@ -74,8 +118,8 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         self.assertEqual(data['deleted'], question.id)
-        self.assertTrue(data['questions'])
-        self.assertTrue(data['totalQuestions'])
+        self.assertEqual(data['totalQuestions'], total - 1)
+        self.assertNotIn('questions', data)
 
     def test_422_unprocessable_delete_question(self):
         question = Question('question', 'answer', 1, 3)
@@ -90,7 +134,7 @@ class TriviaTestCase(unittest.TestCase):
         self.assertFalse(data['success'])
 
     def test_create_question(self):
-        res = self.client().post('/questions', json={
+        res = self.client().post('/questions?include_questions=true', json={
             'question': 'question',
             'answer': 'answer',
             'difficulty': 3,
@@ -104,6 +148,80 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['totalQuestions'])
         self.assertTrue(data['created'])
 
+    def test_create_question_lists_near_duplicates(self):
+        question = Question('Which river is the longest in the world?',
+                            'The Nile', 1, 2)
+        question.insert()
+        with self.app.app_context():
+            self.app.extensions['duplicate_index'].build()
+
+        res = self.client().post('/questions', json={
+            'question': 'Which river is the longest one in the world?',
+            'answer': 'Nile',
+            'difficulty': 2,
+            'category': 1
+        })
+        data = json.loads(res.data)
+        Question.query.get(data['created']).delete()
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['duplicates'][0]['id'], question.id)
+        self.assertGreaterEqual(data['duplicates'][0]['similarity'], 0.7)
+
+    def test_duplicates_unchecked_until_index_built(self):
+        index = DuplicateIndex()
+
+        self.assertIsNone(index.similar('Which river is the longest?'))
+        with self.app.app_context():
+            index.build()
+        self.assertIsNotNone(index.similar('Which river is the longest?'))
+
+    def test_409_reject_duplicate_question(self):
+        app = create_app({'DUPLICATE_POLICY': 'reject'})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        question = Question('Who painted the ceiling of the Sistine Chapel?',
+                            'Michelangelo', 1, 3)
+        # the first create waits for the index with 'reject'
+        question.insert()
+        body = {
+            'question': 'Who painted the ceiling of the Sistine Chapel?',
+            'answer': 'Michelangelo',
+            'difficulty': 3,
+            'category': 1
+        }
+
+        res = client.post('/questions', json=body)
+        data = json.loads(res.data)
+        allowed = client.post('/questions', json={
+            **body, 'allowDuplicate': True})
+        Question.query.get(json.loads(allowed.data)['created']).delete()
+        question.delete()
+
+        self.assertEqual(res.status_code, 409)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['duplicates'][0]['id'], question.id)
+        self.assertEqual(allowed.status_code, 200)
+
+    def test_duplicates_command(self):
+        questions = [Question(text, 'Mercury', 1, 1) for text in (
+            'Which planet is the closest to the sun?',
+            'Which planet is closest to the Sun?')]
+        for question in questions:
+            question.insert()
+
+        result = self.app.test_cli_runner().invoke(
+            args=['trivia', 'duplicates'])
+        for question in questions:
+            question.delete()
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn(f'  {questions[0].id}: {questions[0].question}',
+                      result.output)
+        self.assertIn(f'  {questions[1].id}: {questions[1].question}',
+                      result.output)
+
     def test_422_unprocessable_create_question(self):
         res = self.client().post('/questions', json={
             'question': 'question',
@@ -117,6 +235,54 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'unprocessable')
         self.assertFalse(data['success'])
 
+    def test_bulk_create_questions(self):
+        lines = [
+            {'question': 'bulk question', 'answer': 'answer',
+             'category': 1, 'difficulty': 2},
+            {'question': 'bulk question', 'answer': 'answer',
+             'category': '1', 'difficulty': '4'},
+            {'question': 'bulk question', 'answer': 'answer',
+             'category': 1, 'difficulty': 9}
+        ]
+        res = self.client().post('/questions/bulk', data='\n'.join(
+            json.dumps(line) for line in lines) + '\nnot json\n')
+        data = json.loads(res.data)
+        for question in Question.query.filter(
+                Question.question == 'bulk question'):
+            question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 2)
+        self.assertEqual(data['failed'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [3, 4])
+        self.assertIn('rowsPerSecond', data)
+
+    def test_bulk_update_questions(self):
+        question = Question('question', 'answer', 1, 3)
+        question.insert()
+
+        res = self.client().patch('/questions', json=[
+            {'id': question.id, 'answer': 'new answer', 'difficulty': 5},
+            {'id': -1, 'answer': 'new answer'}
+        ])
+        data = json.loads(res.data)
+        updated = Question.query.get(question.id)
+        answer, difficulty = updated.answer, updated.difficulty
+        updated.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['updated'], 1)
+        self.assertEqual(data['errors'], [
+            {'row': 1, 'error': 'question not found'}])
+        self.assertEqual((answer, difficulty), ('new answer', 5))
+
+    def test_422_bulk_update_questions(self):
+        res = self.client().patch('/questions', json={'id': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
     def test_search_questions(self):
         res = self.client().post('/questions', json={
             'searchTerm': 'question'
@@ -128,15 +294,280 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(data['totalQuestions'])
 
-    def test_404_search_questions(self):
+    def test_search_questions_without_matches(self):
         res = self.client().post('/questions', json={
             'searchTerm': 'questions dosnot exist'
         })
         data = json.loads(res.data)
 
-        self.assertEqual(res.status_code, 404)
-        self.assertEqual(data['message'], 'resource not found')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['totalQuestions'], 0)
+
+    def test_search_questions_highlights_answer_matches(self):
+        question = Question('question', 'searchable answer', 1, 3)
+        question.insert()
+
+        res = self.client().post('/questions', json={
+            'searchTerm': 'searchable'
+        })
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['id'], question.id)
+        self.assertEqual(data['questions'][0]['highlight'], 'question')
+        self.assertEqual(data['questions'][0]['answerHighlight'],
+                         '<mark>searchable</mark> answer')
+
+    def test_search_questions_escapes_highlight(self):
+        question = Question('<b>escaped</b> question', 'answer', 1, 3)
+        question.insert()
+
+        res = self.client().post('/questions', json={
+            'searchTerm': 'escaped'
+        })
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'][0]['id'], question.id)
+        highlight = data['questions'][0]['highlight']
+        self.assertNotIn('<b>', highlight)
+        self.assertIn('&lt;b&gt;', highlight)
+        self.assertIn('<mark>escaped</mark>', highlight)
+
+    def test_search_index_snapshot_discarded_by_update(self):
+        question = Question('question', 'answer', 1, 3)
+        question.insert()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'search.index')
+            app = create_app({'SEARCH_BACKEND': 'memory',
+                              'SEARCH_INDEX_PATH': path})
+            setup_db(app, self.database_path)
+            app.test_client().post('/questions', json={'searchTerm': 'x'})
+            saved = os.path.exists(path)
+            question = Question.query.get(question.id)
+            question.question = 'reworded'
+            question.update()
+            discarded = not os.path.exists(path)
+
+            app = create_app({'SEARCH_BACKEND': 'memory',
+                              'SEARCH_INDEX_PATH': path})
+            setup_db(app, self.database_path)
+            res = app.test_client().post('/questions', json={
+                'searchTerm': 'reworded'
+            })
+            data = json.loads(res.data)
+        question.delete()
+
+        self.assertTrue(saved)
+        self.assertTrue(discarded)
+        self.assertIn(question.id,
+                      [found['id'] for found in data['questions']])
+
+    def test_export_questions_as_json_lines(self):
+        res = self.client().get('/questions/export?format=jsonl')
+        lines = [json.loads(line) for line in res.data.splitlines()]
+        total = json.loads(self.client().get('/questions').data)[
+            'totalQuestions']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(lines), total)
+        self.assertEqual(set(lines[0]), {
+            'id', 'question', 'answer', 'category', 'difficulty'})
+
+    def test_compressed_questions(self):
+        app = create_app({'COMPRESS_MIN_SIZE': 0})
+        setup_db(app, self.database_path)
+
+        res = app.test_client().get('/questions', headers={
+            'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertTrue(data['questions'])
+
+    def test_preflight_max_age(self):
+        res = self.client().options('/quizzes', headers={
+            'Origin': 'http://localhost:3000',
+            'Access-Control-Request-Method': 'POST'
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Access-Control-Max-Age'], str(
+            self.app.config['CORS_MAX_AGE']))
+
+    def test_serve_questions_from_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'questions.snapshot')
+            result = self.app.test_cli_runner().invoke(
+                args=['trivia', 'snapshot', path])
+            app = create_app({'SNAPSHOT_PATH': path})
+            setup_db(app, self.database_path)
+            res = app.test_client().get('/questions?page=1')
+            data = json.loads(res.data)
+            quiz = json.loads(app.test_client().post('/quizzes', json={
+                'quiz_category': '1'}).data)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertNotIn('duplicate_index', app.extensions)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data, json.loads(self.client().get(
+            '/questions?page=1').data))
+        self.assertEqual(quiz['question']['category'], 1)
+
+    def test_retrieve_category_stats(self):
+        category = Category('type')
+        category.insert()
+        questions = [Question('question', 'answer', category.id, difficulty)
+                     for difficulty in (1, 3, 3)]
+        for question in questions:
+            question.insert()
+
+        res = self.client().get('/categories/stats')
+        data = json.loads(res.data)
+        for question in questions:
+            question.delete()
+        category.delete()
+
+        stats = {stat['id']: stat for stat in data['categories']}
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(stats[category.id]['totalQuestions'], 3)
+        self.assertEqual(stats[category.id]['difficulties'], {'1': 1, '3': 2})
+
+    def test_read_cache_stats(self):
+        self.client().get('/categories')
+        self.client().get('/categories')
+
+        res = self.client().get('/cache/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['local']['hits'], 1)
+        self.assertEqual(data['local']['size'], 1)
+        self.assertIsNone(data['shared'])
+
+    def test_read_cache_generation_bumped_by_changes(self):
+        app = create_app({'READ_CACHE_URL': 'memory://'})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        total = json.loads(client.get('/questions').data)['totalQuestions']
+        generation = json.loads(client.get('/cache/stats').data)['generation']
+
+        question = Question('question', 'answer', 1, 3)
+        question.insert()
+        data = json.loads(client.get('/questions').data)
+        stats = json.loads(client.get('/cache/stats').data)
+        question.delete()
+
+        self.assertEqual(data['totalQuestions'], total + 1)
+        self.assertEqual(stats['generation'], generation + 1)
+        self.assertEqual(stats['shared']['misses'], 2)
+
+    def test_read_cache_generation_bumped_once_per_request(self):
+        app = create_app({'READ_CACHE_URL': 'memory://'})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        generation = json.loads(client.get('/cache/stats').data)['generation']
+
+        client.post('/questions/bulk', data='\n'.join(json.dumps({
+            'question': 'bulk question', 'answer': 'answer',
+            'category': 1, 'difficulty': 2}) for _ in range(3)))
+        stats = json.loads(client.get('/cache/stats').data)
+        for question in Question.query.filter(
+                Question.question == 'bulk question'):
+            question.delete()
+
+        self.assertEqual(stats['generation'], generation + 1)
+
+    def test_question_counts_dropped_by_new_generation(self):
+        app = create_app({'READ_CACHE_URL': 'memory://',
+                          'READ_CACHE_GENERATION_TTL': 0})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        total = json.loads(client.get('/questions').data)['totalQuestions']
+
+        # another worker adds a question and bumps the shared generation
+        question = Question('question', 'answer', 1, 3)
+        with app.app_context():
+            Question.query.session.add(question)
+            Question.query.session.commit()
+            question_id = question.id
+            app.extensions['read_cache'].shared.incr(GENERATION_KEY)
+        data = json.loads(client.get('/questions').data)
+        Question.query.get(question_id).delete()
+
+        self.assertEqual(data['totalQuestions'], total + 1)
+
+    def test_apps_keep_their_own_listeners(self):
+        registered = len(question_listeners), len(category_listeners)
+        app = create_app({'SEARCH_BACKEND': 'memory'})
+        setup_db(app, self.database_path)
+
+        self.assertEqual((len(question_listeners), len(category_listeners)),
+                         registered)
+        self.assertTrue(app.extensions['trivia_listeners']['question'])
+
+    def test_401_profile_without_token(self):
+        app = create_app({'PROFILE_TOKEN': 'secret'})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+
+        res = client.post('/debug/profile', json={'pattern': '/categories'})
+        data = json.loads(res.data)
+        non_ascii = client.post('/debug/profile', headers={
+            'Authorization': 'Bearer s\xe9cret'})
+
+        self.assertEqual(res.status_code, 401)
         self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'unauthorized')
+        self.assertEqual(non_ascii.status_code, 401)
+
+    def test_profile_next_requests(self):
+        app = create_app({'PROFILE_TOKEN': 'secret'})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer secret'}
+
+        res = client.post('/debug/profile', headers=headers, json={
+            'pattern': '/categories', 'requests': 2})
+        for _ in range(3):
+            client.get('/categories')
+        status = json.loads(client.get('/debug/profile', headers=headers).data)
+        result = client.get('/debug/profile/result', headers=headers)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(status['captured'], 2)
+        self.assertEqual(status['remaining'], 0)
+        self.assertIsNone(status['pattern'])
+        self.assertEqual(result.status_code, 200)
+        self.assertIn(b'retrieve_categories', result.data)
+
+    def test_profile_sampling_collapsed_stacks(self):
+        app = create_app({'PROFILE_TOKEN': 'secret'})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+        headers = {'Authorization': 'Bearer secret'}
+
+        client.post('/debug/profile', headers=headers, json={
+            'pattern': '/questions', 'requests': 1, 'mode': 'sampling',
+            'interval': 0.001})
+        client.get('/questions')
+        status = json.loads(client.get('/debug/profile', headers=headers).data)
+        pstats = client.get('/debug/profile/result?format=pstats',
+                            headers=headers)
+        result = client.get('/debug/profile/result', headers=headers)
+
+        self.assertEqual(status['captured'], 1)
+        self.assertEqual(pstats.status_code, 422)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.mimetype, 'text/plain')
 
     def test_retrieve_questions_by_category(self):
         res = self.client().get('/categories/1/questions')
@@ -165,6 +596,182 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['question'])
 
+    def test_get_random_question_excludes_previous_questions(self):
+        category = Category('type')
+        category.insert()
+        question = Question('question', 'answer', category.id, 3)
+        question.insert()
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'type', 'id': category.id},
+            'previous_questions': [question.id]
+        })
+        data = json.loads(res.data)
+        question.delete()
+        category.delete()
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+
+    def test_get_adaptive_question(self):
+        category = Category('type')
+        category.insert()
+        questions = [Question('question', 'answer', category.id, difficulty)
+                     for difficulty in (2, 4)]
+        for question in questions:
+            question.insert()
+
+        res = self.client().post('/quizzes', json={
+            'quiz_category': {'type': 'type', 'id': category.id},
+            'adaptive': True,
+            'difficulty': 3,
+            'recent_answers': [True, True, True, True, False, True]
+        })
+        data = json.loads(res.data)
+        for question in questions:
+            question.delete()
+        category.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['targetDifficulty'], 4)
+        self.assertEqual(data['question']['difficulty'], 4)
+
+    def test_429_rate_limited_quizzes(self):
+        app = create_app({'RATE_LIMITS': {'random_question': (0.1, 2)}})
+        setup_db(app, self.database_path)
+        client = app.test_client()
+
+        responses = [client.post('/quizzes', json={'quiz_category': '1'})
+                     for _ in range(3)]
+        data = json.loads(responses[2].data)
+        stats = json.loads(client.get('/limits/stats').data)
+
+        self.assertEqual([res.status_code for res in responses[:2]],
+                         [200, 200])
+        self.assertEqual(responses[2].status_code, 429)
+        self.assertEqual(responses[2].headers['Retry-After'], '10')
+        self.assertFalse(data['success'])
+        self.assertEqual(stats['routes']['random_question']['limited'], 1)
+        self.assertEqual(stats['concurrency']['active'], 0)
+
+    def test_record_quiz_answers(self):
+        for correct in (True, False, True):
+            res = self.client().post('/quizzes/answers', json={
+                'player': 'test player',
+                'quiz_category': {'type': 'type', 'id': 1},
+                'correct': correct
+            })
+        data = json.loads(res.data)
+        leaderboard = json.loads(self.client().get(
+            '/quizzes/leaderboard?category=1&limit=100').data)['leaderboard']
+        with self.app.app_context():
+            self.app.extensions['scoreboard'].flush()
+            score = QuizScore.query.get(('test player', 1))
+            stored = (score.correct, score.answered)
+            QuizScore.query.filter_by(player='test player').delete()
+            QuizScore.query.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['correct'], data['answered']), (2, 3))
+        self.assertIn({'player': 'test player', 'correct': 2, 'answered': 3},
+                      leaderboard)
+        self.assertEqual(stored, (2, 3))
+
+    def test_quiz_scores_flushed_after_interval(self):
+        scoreboard = ScoreBoard(500, 0.1, 60, 10)
+        with self.app.app_context():
+            scoreboard.record('test player', 1, True)
+            early = scoreboard.flush_if_due()
+            time.sleep(0.1)
+            flushed = scoreboard.flush_if_due()
+            score = QuizScore.query.get(('test player', 1))
+            stored = (score.correct, score.answered)
+            QuizScore.query.filter_by(player='test player').delete()
+            QuizScore.query.session.commit()
+
+        self.assertFalse(early)
+        self.assertTrue(flushed)
+        self.assertEqual(stored, (1, 1))
+
+    def test_422_record_quiz_answer_without_player(self):
+        res = self.client().post('/quizzes/answers', json={'correct': True})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_grade_quiz_answers(self):
+        question = Question('Which band recorded Abbey Road?', 'The Beatles',
+                            1, 2)
+        question.insert()
+
+        res = self.client().post('/quizzes/grade', json={'answers': [
+            {'question': question.id, 'answer': 'beatles'},
+            {'question': question.id, 'answer': 'The Beetles!'},
+            {'question': question.id, 'answer': 'The Rolling Stones'},
+            {'question': -1, 'answer': 'beatles'}
+        ]})
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual([result['correct'] for result in data['results']],
+                         [True, True, False, False])
+        self.assertEqual(data['results'][0]['answer'], 'The Beatles')
+        self.assertEqual(data['results'][3]['error'], 'question not found')
+        self.assertEqual(data['correct'], 2)
+
+    def test_422_grade_quiz_answers_without_answers(self):
+        res = self.client().post('/quizzes/grade', json={'answers': 'beatles'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(data['success'])
+
+    def test_quiz_session(self):
+        category = Category('type')
+        category.insert()
+        question = Question('question', 'answer', category.id, 3)
+        question.insert()
+
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': str(category.id)
+        })
+        session_id = json.loads(res.data)['session_id']
+        first = json.loads(self.client().post(
+            f'/quizzes/sessions/{session_id}/next').data)
+        second = json.loads(self.client().post(
+            f'/quizzes/sessions/{session_id}/next').data)
+        question.delete()
+        category.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(first['question']['id'], question.id)
+        self.assertTrue(second['success'])
+        self.assertIsNone(second['question'])
+
+    def test_quiz_deck_kept_while_session_played(self):
+        # sessions and decks expire after 0.2s, unless played
+        sessions = QuizSessions(MemoryStore(), QuestionPool(300), 0.2, 0)
+        found = []
+        with self.app.app_context():
+            session_id, total = sessions.start(None)
+            for _ in range(3):
+                time.sleep(0.1)
+                found.append(sessions.next_question(session_id)[0])
+
+        self.assertTrue(total)
+        self.assertEqual(found, [True, True, True])
+
+    def test_404_quiz_session_not_found(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'resource not found')
+        self.assertFalse(data['success'])
+
     def test_404_get_random_question(self):
         res = self.client().post('/quizzes', json={
             'quiz_category': 'wrong_cat',